@@ -0,0 +1,438 @@
+"""Benchmarks hors-ligne des chemins critiques de la messagerie.
+
+Chaque cas tourne dans un processus neuf (pic de RSS mesurable) avec Streamlit
+remplacé par un bouchon et GitHub remplacé par un stockage en mémoire. Les
+résultats sont émis en JSON lines pour pouvoir comparer deux versions :
+
+    python benchmarks/bench_hot_paths.py --output avant.jsonl
+    python benchmarks/bench_hot_paths.py --output apres.jsonl --compare avant.jsonl
+"""
+import argparse
+import base64
+import functools
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+SHORT_CAPTION = "Coucou 😘"
+LONG_CAPTION = " ".join(["Une journée magnifique au bord de la mer avec le soleil"] * 8)
+MESSAGE_COUNTS = [10, 100, 1000]
+
+
+class _SessionState(dict):
+    """Imite st.session_state : accès par clé ou par attribut"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        del self[name]
+
+
+class _Recorder:
+    """Compte les appels Streamlit et les octets qui seraient envoyés au navigateur"""
+
+    def __init__(self):
+        self.calls = {}
+        self.bytes_sent = 0
+
+    def record(self, name, args, kwargs):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        for value in list(args) + list(kwargs.values()):
+            if isinstance(value, (bytes, bytearray)):
+                self.bytes_sent += len(value)
+
+
+class _Delta:
+    """Remplace un DeltaGenerator : absorbe tous les appels d'affichage"""
+
+    def __init__(self, recorder):
+        self._recorder = recorder
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        recorder = self._recorder
+
+        def call(*args, **kwargs):
+            recorder.record(name, args, kwargs)
+            if name == 'columns':
+                spec = args[0] if args else kwargs.get('spec')
+                count = spec if isinstance(spec, int) else len(spec)
+                return [_Delta(recorder) for _ in range(count)]
+            if name in ('button', 'download_button', 'checkbox', 'toggle'):
+                return False
+            if name in ('text_input', 'text_area'):
+                return ""
+            if name == 'camera_input':
+                return None
+            if name == 'selectbox':
+                options = args[1] if len(args) > 1 else kwargs['options']
+                return list(options)[kwargs.get('index', 0)]
+            if name == 'date_input':
+                return args[1] if len(args) > 1 else kwargs.get('value')
+            return _Delta(recorder)
+
+        return call
+
+
+def _cache_decorator(func=None, **kwargs):
+    """Remplace st.cache_resource / st.cache_data par un simple mémo"""
+    if func is None:
+        return functools.cache
+    return functools.cache(func)
+
+
+def _fragment_decorator(func=None, **kwargs):
+    """Remplace st.fragment : la fonction est appelée telle quelle"""
+    if func is None:
+        return lambda f: f
+    return func
+
+
+def install_streamlit_stub():
+    """Installe un faux module streamlit dans sys.modules et renvoie son enregistreur"""
+    recorder = _Recorder()
+    root = _Delta(recorder)
+    stub = types.ModuleType('streamlit')
+    stub.session_state = _SessionState()
+    stub.secrets = {}
+    stub.cache_resource = _cache_decorator
+    stub.cache_data = _cache_decorator
+    stub.fragment = _fragment_decorator
+    stub.sidebar = _Delta(recorder)
+    stub.__getattr__ = lambda name: getattr(root, name)
+    sys.modules['streamlit'] = stub
+    return recorder
+
+
+class FakeGitHub:
+    """Stockage en mémoire substitué aux fonctions github_* de l'application"""
+
+    def __init__(self, app):
+        self.app = app
+        self.files = {}
+        self.transport = {}
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def get_file(self, file_path):
+        if file_path not in self.files:
+            return None
+        content, sha = self.files[file_path]
+        self.bytes_read += len(content)
+        return {'content': content, 'sha': sha}
+
+    def open_file(self, file_path):
+        if file_path not in self.files:
+            return None
+        content, sha = self.files[file_path]
+        self.bytes_read += len(content)
+        transport = self.transport[file_path]
+        if isinstance(transport, str):
+            return {'stream': self.app.Base64Reader(transport), 'sha': sha}
+        return {'stream': io.BytesIO(transport), 'sha': sha}
+
+    def get_sha(self, file_path):
+        return self.files[file_path][1] if file_path in self.files else None
+
+    def update_file(self, file_path, content, sha=None, message="Update data"):
+        self.bytes_written += len(content)
+        # sha dérivé du contenu, comme pour un blob git
+        self.files[file_path] = (content, hashlib.sha1(content.encode('utf-8')).hexdigest())
+        # Forme servie par l'API : base64 en lignes de 60 caractères sous 900 Ko, blob brut au-delà
+        raw = content.encode('utf-8')
+        self.transport[file_path] = base64.encodebytes(raw).decode('ascii') if len(raw) < 900000 else raw
+        return self.files[file_path][1]
+
+
+def import_app():
+    """Importe streamlit_app avec Streamlit et GitHub bouchonnés"""
+    recorder = install_streamlit_stub()
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import streamlit_app as app
+    app.FEED_STATIC_DIR = tempfile.mkdtemp(prefix='bench_feed_')
+    fake = FakeGitHub(app)
+    app.github_get_file = fake.get_file
+    app.github_open_file = fake.open_file
+    app.github_get_sha = fake.get_sha
+    app.github_update_file = fake.update_file
+    return app, fake, recorder
+
+
+def synthetic_photo(width, height, with_face=False, seed=0):
+    """Photo synthétique de la taille d'une caméra (dégradé + bruit, visage optionnel)"""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[0:height, 0:width]
+    pixels = np.empty((height, width, 3), dtype=np.int16)
+    pixels[..., 0] = x * 255 // width
+    pixels[..., 1] = y * 255 // height
+    pixels[..., 2] = (x + y) * 255 // (width + height)
+    pixels += rng.integers(-20, 20, size=(height, width, 3), dtype=np.int16)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+
+    if with_face:
+        # Visage stylisé reconnu par la cascade frontalface d'OpenCV
+        draw = ImageDraw.Draw(image)
+        sx, sy = width / 640, height / 480
+
+        def box(x0, y0, x1, y1):
+            return [x0 * sx, y0 * sy, x1 * sx, y1 * sy]
+
+        draw.rectangle(box(0, 0, 640, 480), fill=(200, 170, 150))
+        draw.ellipse(box(220, 100, 420, 380), fill=(230, 190, 160))
+        draw.ellipse(box(260, 180, 300, 210), fill=(30, 30, 30))
+        draw.ellipse(box(340, 180, 380, 210), fill=(30, 30, 30))
+        draw.rectangle(box(250, 165, 310, 172), fill=(60, 40, 30))
+        draw.rectangle(box(330, 165, 390, 172), fill=(60, 40, 30))
+        draw.polygon([(320 * sx, 220 * sy), (305 * sx, 280 * sy), (335 * sx, 280 * sy)], fill=(200, 150, 130))
+        draw.ellipse(box(285, 310, 355, 335), fill=(150, 60, 60))
+
+    return image
+
+
+def synthetic_messages(app, count, size):
+    """Liste de messages synthétiques alternant les deux expéditeurs"""
+    messages = []
+    for idx in range(count):
+        original = synthetic_photo(size[0], size[1], seed=idx)
+        messages.append({
+            'timestamp': f"2024-01-{1 + idx % 28:02d}T12:{idx % 60:02d}:00",
+            'text': f"message {idx}",
+            'image_with_text': original,
+            'original_image': original,
+            'sender': 'admin' if idx % 2 else 'user',
+            'id': 1700000000000 + idx,
+        })
+    return messages
+
+
+def _reset_session(app, messages):
+    app.st.session_state.messages = messages
+    app.st.session_state.message_index = app.build_message_index(messages)
+    app.st.session_state.user_passwords = ["crush"]
+    app.st.session_state.stats = app.rebuild_stats(messages)
+
+
+def _timed(func, repeat):
+    """Chronomètre `repeat` appels puis un appel de plus sous tracemalloc (pic alloué)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, result, {'peak_alloc_kb': peak // 1024}
+
+
+def bench_add_text(params, repeat):
+    app, _, _ = import_app()
+    image = synthetic_photo(*params['size'])
+    caption = LONG_CAPTION if params['caption'] == 'long' else SHORT_CAPTION
+    timings, result, extra = _timed(lambda: app.add_text_to_image(image, caption), repeat)
+    encoded = io.BytesIO()
+    result.save(encoded, format='PNG', optimize=False, compress_level=0)
+    return timings, {**extra, 'bytes_written': len(encoded.getvalue())}
+
+
+def bench_verify(params, repeat):
+    app, _, _ = import_app()
+    image = synthetic_photo(*params['size'], with_face=params['hits'])
+    timings, detected, extra = _timed(lambda: app.verify_human_body_simple(image), repeat)
+    return timings, {**extra, 'bytes_written': 0, 'detected': bool(detected)}
+
+
+def bench_ingest(params, repeat):
+    app, _, _ = import_app()
+    jpeg = io.BytesIO()
+    synthetic_photo(*params['size']).save(jpeg, format='JPEG', quality=90)
+    data = jpeg.getvalue()
+    timings, photo, extra = _timed(lambda: app.ingest_photo(io.BytesIO(data)), repeat)
+    return timings, {**extra, 'bytes_written': 0, 'bytes_read': len(data), 'output_size': list(photo['image'].size)}
+
+
+def bench_save(params, repeat):
+    app, fake, _ = import_app()
+    _reset_session(app, synthetic_messages(app, params['messages'], params['size']))
+    timings, _, extra = _timed(app.save_messages, repeat)
+    return timings, {**extra, 'bytes_written': fake.bytes_written // (repeat + 1)}
+
+
+def bench_load(params, repeat):
+    app, fake, _ = import_app()
+    _reset_session(app, synthetic_messages(app, params['messages'], params['size']))
+    app.save_messages()
+    _reset_session(app, [])
+    fake.bytes_read = 0
+    timings, loaded, extra = _timed(app.load_messages, repeat)
+    if len(loaded) != params['messages']:
+        raise RuntimeError(f"{len(loaded)} messages relus sur {params['messages']}")
+    return timings, {**extra, 'bytes_written': 0, 'bytes_read': fake.bytes_read // (repeat + 1)}
+
+
+def bench_feed(params, repeat):
+    app, fake, recorder = import_app()
+    _reset_session(app, synthetic_messages(app, params['messages'], params['size']))
+    state = app.st.session_state
+    state.authenticated = True
+    state.is_admin = True
+    state.current_user = 'admin'
+    state.last_message_count = params['messages']
+    recorder.bytes_sent = 0
+    recorder.calls.clear()
+    timings, _, extra = _timed(app.main_app, repeat)
+    return timings, {
+        **extra,
+        'bytes_written': recorder.bytes_sent // (repeat + 1),
+        'st_calls': sum(recorder.calls.values()) // (repeat + 1),
+        'github_bytes': (fake.bytes_read + fake.bytes_written) // (repeat + 1),
+    }
+
+
+BENCHMARKS = {
+    'add_text_to_image': bench_add_text,
+    'verify_human_body_simple': bench_verify,
+    'ingest_photo': bench_ingest,
+    'save_messages': bench_save,
+    'load_messages': bench_load,
+    'feed_render': bench_feed,
+}
+
+
+def build_cases(message_size, feed_messages, quick):
+    """Liste (nom, paramètres) de tous les cas à exécuter"""
+    resolutions = RESOLUTIONS[:1] if quick else RESOLUTIONS
+    counts = MESSAGE_COUNTS[:2] if quick else MESSAGE_COUNTS
+    cases = []
+    for size in resolutions:
+        for caption in ('short', 'long'):
+            cases.append(('add_text_to_image', {'size': size, 'caption': caption}))
+    for size in resolutions:
+        for hits in (False, True):
+            cases.append(('verify_human_body_simple', {'size': size, 'hits': hits}))
+    for size in resolutions + [(4032, 3024)]:
+        cases.append(('ingest_photo', {'size': size}))
+    for count in counts:
+        cases.append(('save_messages', {'messages': count, 'size': message_size}))
+        cases.append(('load_messages', {'messages': count, 'size': message_size}))
+    cases.append(('feed_render', {'messages': feed_messages, 'size': (640, 480)}))
+    return cases
+
+
+def _run_case(name, params, repeat):
+    """Exécuté dans un processus fils : renvoie le résultat d'un cas"""
+    timings, extra = BENCHMARKS[name](params, repeat)
+    # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'peak_rss_kb': peak,
+        **extra,
+    }
+
+
+def _revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def case_key(record):
+    return f"{record['bench']} {json.dumps(record['params'], sort_keys=True)}"
+
+
+def compare(results, baseline_path):
+    """Affiche l'écart de temps et de mémoire par rapport à un fichier de référence"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {case_key(r): r for r in map(json.loads, f) if 'bench' in r}
+
+    print(f"\n{'cas':<75} {'temps':>9} {'RSS':>9}", file=sys.stderr)
+    for record in results:
+        old = baseline.get(case_key(record))
+        if not old:
+            continue
+        time_delta = record['seconds_median'] / old['seconds_median'] - 1 if old['seconds_median'] else 0
+        rss_delta = record['peak_rss_kb'] / old['peak_rss_kb'] - 1 if old['peak_rss_kb'] else 0
+        print(f"{case_key(record):<75} {time_delta:>+9.1%} {rss_delta:>+9.1%}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins critiques de streamlit_app.py")
+    parser.add_argument('--output', help="fichier JSON lines (stdout par défaut)")
+    parser.add_argument('--compare', help="résultats de référence à comparer")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help="ne lancer que ce benchmark")
+    parser.add_argument('--message-size', default='160x120', help="taille des photos pour la sérialisation (LxH)")
+    parser.add_argument('--feed-messages', type=int, default=20)
+    parser.add_argument('--quick', action='store_true', help="sous-ensemble rapide des cas")
+    args = parser.parse_args(argv)
+
+    message_size = tuple(int(v) for v in args.message_size.split('x'))
+    cases = [
+        (name, params) for name, params in build_cases(message_size, args.feed_messages, args.quick)
+        if not args.only or name in args.only
+    ]
+
+    meta = {'revision': _revision(), 'python': platform.python_version()}
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    results = []
+    context = multiprocessing.get_context('spawn')
+    try:
+        for name, params in cases:
+            with context.Pool(1) as pool:
+                measures = pool.apply(_run_case, (name, params, args.repeat))
+            record = {'bench': name, 'params': params, **measures, **meta}
+            results.append(record)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            print(f"{name} {params} : {measures['seconds_median'] * 1000:.1f} ms, "
+                  f"{measures['peak_rss_kb'] // 1024} Mo", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,513 @@
+"""Test de charge : N sessions simultanées contre un faux GitHub / Telegram local.
+
+Un serveur HTTP (processus séparé) imite les endpoints Contents et Blob de
+GitHub et le sendMessage de Telegram, avec contrôle du sha comme l'API réelle
+(409 si le sha envoyé n'est plus le bon). L'application tourne dans ce
+processus, Streamlit remplacé par le bouchon de bench_hot_paths.py et un
+session_state par thread, comme les sessions d'un même serveur Streamlit.
+
+Chaque session se connecte puis enchaîne envois, suppressions et rechargements.
+Le résultat (une ligne JSON) donne le débit, les percentiles de latence par
+action, les conflits vus par le serveur, les écritures perdues et la mémoire
+par session :
+
+    python benchmarks/load_sessions.py --sessions 4 --output avant.jsonl
+    python benchmarks/load_sessions.py --sessions 4 --output apres.jsonl --compare avant.jsonl
+"""
+import argparse
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import bench_hot_paths as bench
+
+REPO = "load/test"
+BOT_TOKEN = "load-test"
+CONTENT_LIMIT = 1024 * 1024
+KEPT_BLOBS = 16
+ACTIONS = ('send', 'delete', 'reload')
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.files = {}
+        self.blobs = {}
+        self.counters = {'requests': {}, 'conflicts': {}, 'writes': {}, 'bytes_in': 0, 'bytes_out': 0, 'telegram': 0}
+
+    def count(self, kind, path=None, bucket='requests'):
+        with self.lock:
+            key = f"{kind} {path}" if path else kind
+            self.counters[bucket][key] = self.counters[bucket].get(key, 0) + 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Sous-ensemble de l'API GitHub Contents / Blob et de l'API Bot Telegram"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        with self.server.lock:
+            self.server.counters['bytes_out'] += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.counters['bytes_in'] += len(body)
+        return body
+
+    def route(self):
+        time.sleep(self.server.latency)
+        prefix = f"/repos/{REPO}/"
+        path = self.path.split('?')[0]
+        if path.startswith(prefix + "contents/"):
+            return 'contents', path[len(prefix + "contents/"):]
+        if path.startswith(prefix + "git/blobs/"):
+            return 'blob', path[len(prefix + "git/blobs/"):]
+        if path == f"/bot{BOT_TOKEN}/sendMessage":
+            return 'telegram', None
+        if path == "/_stub/stats":
+            return 'stats', None
+        return None, None
+
+    def do_GET(self):
+        kind, target = self.route()
+        if kind == 'stats':
+            with self.server.lock:
+                counters = json.loads(json.dumps(self.server.counters))
+            return self.reply(200, counters)
+        self.server.count(f"GET {kind}")
+
+        if kind == 'contents':
+            with self.server.lock:
+                entry = self.server.files.get(target)
+            if entry is None:
+                return self.reply(404, {"message": "Not Found"})
+            content, sha = entry
+            encoded = base64.encodebytes(content).decode('ascii') if len(content) <= CONTENT_LIMIT else ""
+            return self.reply(200, {
+                "name": os.path.basename(target), "path": target, "sha": sha, "size": len(content),
+                "content": encoded, "encoding": "base64" if encoded else "none"
+            })
+
+        if kind == 'blob':
+            with self.server.lock:
+                content = self.server.blobs.get(target)
+            if content is None:
+                return self.reply(404, {"message": "Not Found"})
+            if "raw" in self.headers.get('Accept', ""):
+                return self.reply(200, content, "application/octet-stream")
+            return self.reply(200, {
+                "sha": target, "size": len(content),
+                "content": base64.encodebytes(content).decode('ascii'), "encoding": "base64"
+            })
+
+        self.reply(404, {"message": "Not Found"})
+
+    def do_PUT(self):
+        kind, target = self.route()
+        body = self.read_body()
+        if kind != 'contents':
+            return self.reply(404, {"message": "Not Found"})
+        self.server.count("PUT contents")
+
+        data = json.loads(body)
+        content = base64.b64decode(data['content'])
+        sha = hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+        with self.server.lock:
+            current = self.server.files.get(target)
+            current_sha = current[1] if current else None
+            # Mêmes règles que GitHub : sha obligatoire pour remplacer, et ce doit être le dernier
+            if data.get('sha') != current_sha:
+                conflict = True
+            else:
+                conflict = False
+                self.server.files[target] = (content, sha)
+                self.server.blobs[sha] = content
+                while len(self.server.blobs) > KEPT_BLOBS:
+                    self.server.blobs.pop(next(iter(self.server.blobs)))
+        if conflict:
+            self.server.count("conflict", target, 'conflicts')
+            status = 422 if current and not data.get('sha') else 409
+            return self.reply(status, {"message": f"{target} does not match {data.get('sha')}"})
+
+        self.server.count("write", target, 'writes')
+        self.reply(200 if current else 201, {"content": {"path": target, "sha": sha, "size": len(content)}})
+
+    def do_POST(self):
+        kind, _ = self.route()
+        self.read_body()
+        if kind != 'telegram':
+            return self.reply(404, {"ok": False})
+        self.server.count("POST telegram")
+        with self.server.lock:
+            self.server.counters['telegram'] += 1
+            message_id = self.server.counters['telegram']
+        self.reply(200, {"ok": True, "result": {"message_id": message_id}})
+
+
+def run_stub(conn, latency):
+    """Point d'entrée du processus serveur : envoie le port choisi puis sert jusqu'à la fin"""
+    server = StubServer(('127.0.0.1', 0), latency)
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+class ThreadSessionState:
+    """st.session_state propre à chaque thread, comme une session Streamlit par navigateur"""
+
+    def __init__(self):
+        object.__setattr__(self, '_local', threading.local())
+
+    def _state(self):
+        local = self._local
+        if not hasattr(local, 'state'):
+            local.state = bench._SessionState()
+        return local.state
+
+    def bind(self, state):
+        self._local.state = state
+
+    def __getattr__(self, name):
+        return getattr(self._state(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._state(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._state(), name)
+
+    def __contains__(self, key):
+        return key in self._state()
+
+    def __getitem__(self, key):
+        return self._state()[key]
+
+    def __setitem__(self, key, value):
+        self._state()[key] = value
+
+    def get(self, key, default=None):
+        return self._state().get(key, default)
+
+
+def import_app(base_url):
+    """Importe streamlit_app avec Streamlit bouchonné et les API pointées vers le serveur local"""
+    bench.install_streamlit_stub()
+    stub = sys.modules['streamlit']
+    stub.session_state = ThreadSessionState()
+    stub.secrets = {
+        "GITHUB_TOKEN": "load-test", "GITHUB_REPO": REPO, "GITHUB_API_URL": base_url,
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN, "TELEGRAM_GROUP_CHAT_ID": "1", "TELEGRAM_API_URL": base_url,
+    }
+    if bench.REPO_ROOT not in sys.path:
+        sys.path.insert(0, bench.REPO_ROOT)
+    import streamlit_app as app
+    if not hasattr(app, 'GITHUB_API_URL'):
+        raise SystemExit("Cette version de streamlit_app.py ne permet pas de rediriger l'API GitHub")
+    app.FEED_STATIC_DIR = tempfile.mkdtemp(prefix='load_feed_')
+    return app
+
+
+def peak_rss_kb():
+    # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def current_rss_kb():
+    """RSS courant (Linux) ; pic de RSS à défaut"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return peak_rss_kb()
+
+
+def counters_delta(after, before):
+    """Compteurs du serveur accumulés entre deux relevés"""
+    if isinstance(after, dict):
+        return {key: counters_delta(value, before.get(key, {} if isinstance(value, dict) else 0))
+                for key, value in after.items()}
+    return after - before
+
+
+def percentiles(values):
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {'n': len(ordered), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'max_ms': pick(1.0)}
+
+
+class Session:
+    """Une session simulée : connexion puis actions tirées au hasard"""
+
+    def __init__(self, app, number, args):
+        self.app = app
+        self.number = number
+        self.args = args
+        self.sender = 'admin' if number % 2 else 'user'
+        self.rng = random.Random(number)
+        self.state = bench._SessionState()
+        self.timings = {action: [] for action in ('login',) + ACTIONS}
+        self.sent = []
+        self.deleted = []
+        self.errors = 0
+        self.failed_sends = 0
+
+    def login(self):
+        st = self.app.st
+        if self.sender == 'user' and "crush" not in self.app.get_user_passwords():
+            raise RuntimeError("mot de passe utilisateur refusé")
+        st.session_state.authenticated = True
+        st.session_state.is_admin = self.sender == 'admin'
+        st.session_state.current_user = self.sender
+        self.app.adopt_history()
+        st.session_state.last_message_count = len(st.session_state.messages)
+
+    def send(self):
+        attempt = len(self.sent) + self.failed_sends
+        caption = f"s{self.number}-{attempt}"
+        width, height = self.args.size
+        photo = bench.synthetic_photo(width, height, seed=self.number * 1000 + attempt)
+        saved = self.app.save_message(self.app.add_text_to_image(photo, caption), caption, photo, self.sender)
+        # Échec signalé à l'utilisateur (False) : pas une écriture perdue en silence
+        if saved is False:
+            self.failed_sends += 1
+        else:
+            self.sent.append(caption)
+
+    def deletable(self):
+        """Ses propres messages encore visibles dans sa session"""
+        alive = set(self.sent) - set(self.deleted)
+        return [msg for msg in self.app.st.session_state.messages if msg['text'] in alive]
+
+    def delete(self):
+        msg = self.rng.choice(self.deletable())
+        self.app.delete_message(msg['id'])
+        self.deleted.append(msg['text'])
+
+    def reload(self):
+        self.app.invalidate_prefetch()
+        self.app.adopt_history()
+
+    def timed(self, action, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            self.errors += 1
+            print(f"session {self.number} / {action} : {e!r}", file=sys.stderr)
+        self.timings[action].append(time.perf_counter() - start)
+
+    def run(self):
+        self.app.st.session_state.bind(self.state)
+        self.timed('login', self.login)
+        weights = [self.args.mix[action] for action in ACTIONS]
+        for _ in range(self.args.actions):
+            if self.args.think_ms:
+                time.sleep(self.rng.uniform(0, 2 * self.args.think_ms) / 1000)
+            action = self.rng.choices(ACTIONS, weights)[0]
+            if action == 'delete' and not self.deletable():
+                action = 'send'
+            self.timed(action, getattr(self, action))
+
+
+def seed_history(app, args):
+    """Publie un historique initial via l'application elle-même (vrais appels HTTP)"""
+    state = bench._SessionState()
+    app.st.session_state.bind(state)
+    messages = bench.synthetic_messages(app, args.history, args.size)
+    for msg in messages:
+        msg['text'] = f"seed-{msg['id']}"
+    bench._reset_session(app, messages)
+    app.save_messages()
+    app.save_stats()
+    app.invalidate_prefetch()
+    return [msg['text'] for msg in messages]
+
+
+def final_state(base_url):
+    """Relit les messages et les compteurs publiés sur le serveur"""
+    def fetch(path):
+        response = requests.get(f"{base_url}/repos/{REPO}/contents/{path}", timeout=30)
+        if response.status_code != 200:
+            return None
+        info = response.json()
+        if info['content']:
+            return json.loads(base64.b64decode(info['content']))
+        blob = requests.get(f"{base_url}/repos/{REPO}/git/blobs/{info['sha']}",
+                            headers={"Accept": "application/vnd.github.raw+json"}, timeout=30)
+        return json.loads(blob.content)
+
+    data = fetch("messages_data.json") or {'messages': []}
+    settings = fetch("settings_data.json")
+    return [msg['text'] for msg in data['messages']], settings
+
+
+def run_load(args):
+    parent, child = multiprocessing.get_context('spawn').Pipe()
+    server = multiprocessing.get_context('spawn').Process(target=run_stub, args=(child, args.latency_ms / 1000), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{parent.recv()}"
+    try:
+        app = import_app(base_url)
+        app.get_prefetch_state()
+        seeded = seed_history(app, args)
+        counters_before = requests.get(f"{base_url}/_stub/stats", timeout=5).json()
+
+        rss_base = current_rss_kb()
+        sessions = [Session(app, number, args) for number in range(args.sessions)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            for future in [pool.submit(session.run) for session in sessions]:
+                future.result()
+        wall = time.perf_counter() - start
+        rss_after = current_rss_kb()
+
+        counters = counters_delta(requests.get(f"{base_url}/_stub/stats", timeout=5).json(), counters_before)
+        final_texts, settings = final_state(base_url)
+    finally:
+        server.terminate()
+        server.join()
+
+    final = set(final_texts)
+    sent = {caption for session in sessions for caption in session.sent}
+    deleted = {caption for session in sessions for caption in session.deleted}
+    expected = (set(seeded) | sent) - deleted
+    actions = sum(len(session.timings[action]) for session in sessions for action in ACTIONS)
+    published_count = settings['stats'].get('message_count') if settings and 'stats' in settings else None
+
+    return {
+        'wall_seconds': round(wall, 3),
+        'actions': actions,
+        'throughput_actions_per_s': round(actions / wall, 2) if wall else None,
+        'latency': {
+            action: percentiles([t for session in sessions for t in session.timings[action]])
+            for action in ('login',) + ACTIONS
+            if any(session.timings[action] for session in sessions)
+        },
+        'errors': sum(session.errors for session in sessions),
+        'sent': len(sent),
+        'failed_sends': sum(session.failed_sends for session in sessions),
+        'deleted': len(deleted),
+        'lost_sends': len((sent - deleted) - final),
+        'resurrected_deletes': len(deleted & final),
+        'lost_seed': len(set(seeded) - deleted - final),
+        'final_messages': len(final_texts),
+        'expected_messages': len(expected),
+        'duplicates': len(final_texts) - len(final),
+        'published_count_drift': None if published_count is None else published_count - len(final_texts),
+        'server': counters,
+        'conflicts': sum(counters['conflicts'].values()),
+        'rss_base_kb': rss_base,
+        'rss_per_session_kb': (rss_after - rss_base) // args.sessions,
+        'peak_rss_kb': peak_rss_kb(),
+        'app_phases': app.metrics_summary(),
+    }
+
+
+def compare(record, baseline_path):
+    """Affiche les écarts avec le résultat de référence aux mêmes paramètres"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {bench.case_key(r): r for r in map(json.loads, f) if r.get('bench') == 'load_sessions'}
+    old = baseline.get(bench.case_key(record))
+    if not old:
+        print("Pas de référence avec les mêmes paramètres", file=sys.stderr)
+        return
+
+    def delta(new, before):
+        return f"{new / before - 1:+.1%}" if before else "n/a"
+
+    print(f"\ndébit          {delta(record['throughput_actions_per_s'], old['throughput_actions_per_s'])}", file=sys.stderr)
+    for action, stats in record['latency'].items():
+        if action in old['latency']:
+            print(f"{action:<14} p95 {delta(stats['p95_ms'], old['latency'][action]['p95_ms'])}", file=sys.stderr)
+    print(f"mémoire/session {delta(record['rss_per_session_kb'], old['rss_per_session_kb'])}", file=sys.stderr)
+    for key in ('conflicts', 'lost_sends', 'resurrected_deletes'):
+        print(f"{key:<14} {old[key]} -> {record[key]}", file=sys.stderr)
+
+
+def parse_mix(text):
+    """'send=3,delete=1,reload=1' -> poids par action"""
+    mix = dict.fromkeys(ACTIONS, 0)
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"action inconnue : {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sessions simultanées contre un GitHub / Telegram local")
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--actions', type=int, default=10, help="actions par session après la connexion")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('send=3,delete=1,reload=1'))
+    parser.add_argument('--history', type=int, default=20, help="messages déjà publiés au départ")
+    parser.add_argument('--size', default='160x120', help="taille des photos envoyées (LxH)")
+    parser.add_argument('--latency-ms', type=float, default=20, help="latence ajoutée à chaque requête par le serveur")
+    parser.add_argument('--think-ms', type=float, default=0, help="pause moyenne entre deux actions")
+    parser.add_argument('--output', help="fichier JSON lines (ajout, stdout par défaut)")
+    parser.add_argument('--compare', help="résultats de référence à comparer")
+    args = parser.parse_args(argv)
+    args.size = tuple(int(v) for v in args.size.split('x'))
+
+    params = {
+        'sessions': args.sessions, 'actions': args.actions, 'mix': args.mix, 'history': args.history,
+        'size': list(args.size), 'latency_ms': args.latency_ms, 'think_ms': args.think_ms,
+    }
+    record = {
+        'bench': 'load_sessions', 'params': params, **run_load(args),
+        'revision': bench._revision(), 'python': platform.python_version(),
+    }
+
+    # Comparer avant d'écrire : --output et --compare peuvent désigner le même fichier
+    if args.compare:
+        compare(record, args.compare)
+
+    line = json.dumps(record) + "\n"
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(line)
+    else:
+        sys.stdout.write(line)
+
+    latency = ", ".join(f"{action} p95 {stats['p95_ms']:.0f} ms" for action, stats in record['latency'].items())
+    print(f"{record['actions']} actions en {record['wall_seconds']:.1f} s "
+          f"({record['throughput_actions_per_s']} /s) ; {latency}", file=sys.stderr)
+    print(f"conflits {record['conflicts']}, envois refusés {record['failed_sends']}, envois perdus {record['lost_sends']}, "
+          f"suppressions annulées {record['resurrected_deletes']}, "
+          f"{record['rss_per_session_kb'] // 1024} Mo par session", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Recompresse et reconditionne l'historique messages_data.json hors-ligne.
+
+Les images écrites par save_messages() sont des PNG sans compression. Ce script
+relit le fichier en flux, réencode chaque image sur tous les cœurs, vérifie que
+le résultat se décode aux mêmes dimensions et écrit un fichier que
+load_messages() sait toujours lire :
+
+    python scripts/repack_history.py messages_data.json repacked.json
+    python scripts/repack_history.py --fetch messages_data.json repacked.json
+
+La mémoire reste bornée (quelques messages en vol) et un traitement interrompu
+reprend là où il s'était arrêté en relançant la même commande.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import ijson
+import requests
+from PIL import Image
+
+IMAGE_FIELDS = ('image_with_text_b64', 'original_image_b64')
+EXTRA_FIELDS = ('passwords', 'counters')
+
+
+def fetch_data_file(path, file_path="messages_data.json"):
+    """Télécharge le fichier de données depuis GitHub directement sur disque"""
+    token = os.environ.get("GITHUB_TOKEN", "")
+    repo = os.environ.get("GITHUB_REPO", "")
+    if not token or not repo:
+        raise SystemExit("GITHUB_TOKEN et GITHUB_REPO doivent être définis pour --fetch")
+
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    response = requests.get(f"https://api.github.com/repos/{repo}/contents/{file_path}", headers=headers, timeout=10)
+    response.raise_for_status()
+    sha = response.json()['sha']
+
+    headers["Accept"] = "application/vnd.github.raw+json"
+    with requests.get(f"https://api.github.com/repos/{repo}/git/blobs/{sha}", headers=headers, timeout=30, stream=True) as blob:
+        blob.raise_for_status()
+        with open(path, 'wb') as f:
+            for chunk in blob.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+    return sha
+
+
+def recompress_image(b64_data, image_format, quality):
+    """Réencode une image base64 ; garde l'originale si le résultat n'est pas plus petit
+
+    Exécuté dans un processus du pool. Renvoie (base64, taille avant, taille après).
+    """
+    original = base64.b64decode(b64_data)
+    image = Image.open(io.BytesIO(original))
+    image.load()
+
+    encoded = io.BytesIO()
+    if image_format == 'jpeg':
+        image.convert('RGB').save(encoded, format='JPEG', quality=quality, optimize=True)
+    else:
+        image.save(encoded, format='PNG', optimize=True, compress_level=9)
+    candidate = encoded.getvalue()
+
+    check = Image.open(io.BytesIO(candidate))
+    check.load()
+    if check.size != image.size:
+        raise ValueError(f"dimensions {check.size} au lieu de {image.size}")
+    if image_format == 'png' and check.tobytes() != image.tobytes():
+        raise ValueError("pixels différents après réencodage PNG")
+
+    if len(candidate) >= len(original):
+        return b64_data, len(original), len(original)
+    return base64.b64encode(candidate).decode(), len(original), len(candidate)
+
+
+def read_extra_fields(path):
+    """Relit les petits champs de premier niveau (mots de passe, compteurs)"""
+    extras = {}
+    for key in EXTRA_FIELDS:
+        with open(path, 'rb') as f:
+            value = next(ijson.items(f, key, use_float=True), None)
+        if value is not None:
+            extras[key] = value
+    return extras
+
+
+def new_progress():
+    return {'done': 0, 'offset': 0, 'before': 0, 'after': 0, 'failed': 0}
+
+
+def load_progress(progress_path):
+    if not os.path.exists(progress_path):
+        return new_progress()
+    with open(progress_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_progress(progress_path, progress):
+    tmp_path = progress_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_path)
+
+
+def submit_message(pool, msg, image_format, quality):
+    """Soumet les images d'un message au pool ; renvoie (message, {champ: future})"""
+    futures = {
+        field: pool.submit(recompress_image, msg[field], image_format, quality)
+        for field in IMAGE_FIELDS if field in msg
+    }
+    return msg, futures
+
+
+def repack(input_path, output_path, image_format='png', quality=85, workers=None, window=None):
+    """Réencode tous les messages de input_path vers output_path, avec reprise possible"""
+    partial_path = output_path + ".partial"
+    progress_path = output_path + ".progress"
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * 2
+
+    progress = load_progress(progress_path)
+    if progress['done'] and os.path.exists(partial_path):
+        print(f"Reprise après {progress['done']} messages", file=sys.stderr)
+        out = open(partial_path, 'r+b')
+        out.seek(progress['offset'])
+        out.truncate()
+    else:
+        progress = new_progress()
+        out = open(partial_path, 'wb')
+        out.write(b'{"messages": [\n')
+
+    def write_message(msg, futures):
+        for field, future in futures.items():
+            try:
+                msg[field], before, after = future.result()
+            except Exception as e:
+                print(f"Message {msg.get('id')} / {field} conservé tel quel : {e}", file=sys.stderr)
+                before = after = len(msg[field]) * 3 // 4
+                progress['failed'] += 1
+            progress['before'] += before
+            progress['after'] += after
+
+        separator = b",\n" if progress['done'] else b""
+        out.write(separator + json.dumps(msg).encode('utf-8'))
+        progress['done'] += 1
+        out.flush()
+        progress['offset'] = out.tell()
+        save_progress(progress_path, progress)
+        if progress['done'] % 50 == 0:
+            print(f"{progress['done']} messages traités", file=sys.stderr)
+
+    try:
+        with open(input_path, 'rb') as f, ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for position, msg in enumerate(ijson.items(f, 'messages.item', use_float=True)):
+                if position < progress['done']:
+                    continue
+                in_flight.append(submit_message(pool, msg, image_format, quality))
+                if len(in_flight) >= window:
+                    write_message(*in_flight.popleft())
+            while in_flight:
+                write_message(*in_flight.popleft())
+
+        tail = json.dumps(read_extra_fields(input_path))[1:]
+        out.write(b"\n]" + (b", " + tail.encode('utf-8') if tail != "}" else b"}"))
+    finally:
+        out.close()
+
+    os.replace(partial_path, output_path)
+    os.remove(progress_path)
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompresse les images de l'historique en parallèle")
+    parser.add_argument('input', help="copie locale de messages_data.json")
+    parser.add_argument('output', help="fichier reconditionné à écrire")
+    parser.add_argument('--fetch', action='store_true', help="télécharge d'abord le fichier depuis GitHub vers input")
+    parser.add_argument('--format', choices=['png', 'jpeg'], default='png', help="png (sans perte, défaut) ou jpeg")
+    parser.add_argument('--quality', type=int, default=85, help="qualité JPEG")
+    parser.add_argument('--workers', type=int, default=None, help="processus (tous les cœurs par défaut)")
+    parser.add_argument('--window', type=int, default=None, help="messages en vol au maximum (2 × processus par défaut)")
+    args = parser.parse_args(argv)
+
+    if args.fetch and not os.path.exists(args.output + ".progress"):
+        sha = fetch_data_file(args.input)
+        print(f"Téléchargé {args.input} (sha {sha})", file=sys.stderr)
+
+    size_before = os.path.getsize(args.input)
+    progress = repack(args.input, args.output, args.format, args.quality, args.workers, args.window)
+    size_after = os.path.getsize(args.output)
+
+    print(f"Messages : {progress['done']} (images conservées telles quelles : {progress['failed']})")
+    print(f"Images   : {progress['before'] / 1e6:.1f} Mo -> {progress['after'] / 1e6:.1f} Mo")
+    print(f"Fichier  : {size_before / 1e6:.1f} Mo -> {size_after / 1e6:.1f} Mo "
+          f"({(1 - size_after / size_before) if size_before else 0:.0%} de gain)")
+
+
+if __name__ == '__main__':
+    main()
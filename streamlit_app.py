@@ -1,11 +1,33 @@
 import streamlit as st
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
 import io
 import json
 import os
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import base64
+import hashlib
+import hmac
+import re
 import requests
+import shutil
+import time
+import threading
+import tempfile
+import zipfile
+import zlib
+import marshal
+import cProfile
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
 
 # Configuration de la page
 st.set_page_config(page_title="Messagerie", page_icon="📸", layout="centered")
@@ -177,16 +199,84 @@ st.markdown("""
 GITHUB_TOKEN = st.secrets.get("GITHUB_TOKEN", "") if hasattr(st, 'secrets') else ""
 GITHUB_REPO = st.secrets.get("GITHUB_REPO", "") if hasattr(st, 'secrets') else ""
 GITHUB_BRANCH = "main"
+# Surchargeables pour pointer vers un bouchon local (benchmarks/load_sessions.py)
+GITHUB_API_URL = st.secrets.get("GITHUB_API_URL", "https://api.github.com") if hasattr(st, 'secrets') else "https://api.github.com"
 DATA_FILE = "messages_data.json"
+SETTINGS_FILE = "settings_data.json"
+SETTINGS_WRITE_ATTEMPTS = 3
+FEED_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "feed")
+# Vide : clé tirée au hasard à chaque démarrage (les URL du fil changent à chaque redémarrage)
+FEED_URL_KEY = st.secrets.get("FEED_URL_KEY", "") if hasattr(st, 'secrets') else ""
 TELEGRAM_BOT_TOKEN = st.secrets.get("TELEGRAM_BOT_TOKEN", "") if hasattr(st, 'secrets') else ""
 TELEGRAM_GROUP_CHAT_ID = st.secrets.get("TELEGRAM_GROUP_CHAT_ID", "") if hasattr(st, 'secrets') else ""
+TELEGRAM_API_URL = st.secrets.get("TELEGRAM_API_URL", "https://api.telegram.org") if hasattr(st, 'secrets') else "https://api.telegram.org"
+METRICS_BUFFER_SIZE = 500
+FEED_JPEG_QUALITY = 85
+MAX_IMAGE_EDGE = int(st.secrets.get("MAX_IMAGE_EDGE", 1280)) if hasattr(st, 'secrets') else 1280
+DUPLICATE_HASH_THRESHOLD = int(st.secrets.get("DUPLICATE_HASH_THRESHOLD", 6)) if hasattr(st, 'secrets') else 6
+PREFETCH_TTL_SECONDS = 30
+DUPLICATE_WINDOW_SECONDS = int(st.secrets.get("DUPLICATE_WINDOW_SECONDS", 120)) if hasattr(st, 'secrets') else 120
+
+@st.cache_resource
+def get_metrics():
+    """Tampon circulaire des dernières mesures, partagé entre les sessions"""
+    return {'samples': deque(maxlen=METRICS_BUFFER_SIZE), 'lock': threading.Lock()}
+
+@contextmanager
+def timed(phase):
+    """Mesure la durée d'une phase ; l'appelant peut renseigner sample['bytes']"""
+    sample = {'phase': phase, 'bytes': 0}
+    start = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        sample['ms'] = (time.perf_counter() - start) * 1000
+        sample['ts'] = time.time()
+        metrics = get_metrics()
+        with metrics['lock']:
+            metrics['samples'].append(sample)
+
+def percentile(sorted_values, pct):
+    """Percentile par rang le plus proche sur une liste déjà triée"""
+    index = max(0, int(round(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+def metrics_summary():
+    """Agrège les mesures récentes par phase : n, p50, p95, max et octets"""
+    metrics = get_metrics()
+    with metrics['lock']:
+        samples = list(metrics['samples'])
+    
+    by_phase = {}
+    for sample in samples:
+        by_phase.setdefault(sample['phase'], []).append(sample)
+    
+    rows = []
+    for phase, phase_samples in sorted(by_phase.items()):
+        durations = sorted(s['ms'] for s in phase_samples)
+        rows.append({
+            'phase': phase,
+            'n': len(durations),
+            'p50 (ms)': round(percentile(durations, 50), 1),
+            'p95 (ms)': round(percentile(durations, 95), 1),
+            'max (ms)': round(durations[-1], 1),
+            'octets': sum(s['bytes'] for s in phase_samples),
+        })
+    return rows
+
+def metrics_jsonl():
+    """Exporte les mesures du tampon en JSON lines"""
+    metrics = get_metrics()
+    with metrics['lock']:
+        samples = list(metrics['samples'])
+    return "".join(json.dumps(sample) + "\n" for sample in samples)
 
 def github_update_file(file_path, content, sha=None, message="Update data"):
-    """Met à jour un fichier sur GitHub"""
+    """Met à jour un fichier sur GitHub ; renvoie le nouveau sha, ou False en cas d'échec"""
     if not GITHUB_TOKEN or not GITHUB_REPO:
         return False
     
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{file_path}"
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{file_path}"
     headers = {
         "Authorization": f"token {GITHUB_TOKEN}",
         "Accept": "application/vnd.github.v3+json"
@@ -202,28 +292,42 @@ def github_update_file(file_path, content, sha=None, message="Update data"):
         data["sha"] = sha
     
     try:
-        response = requests.put(url, headers=headers, json=data, timeout=10)
-        return response.status_code in [200, 201]
+        with timed("github_put") as sample:
+            sample['bytes'] = len(data["content"])
+            response = requests.put(url, headers=headers, json=data, timeout=10)
+        if response.status_code not in [200, 201]:
+            return False
+        return response.json().get('content', {}).get('sha') or True
     except Exception as e:
         st.error(f"Erreur GitHub UPDATE: {str(e)}")
         return False
 
+class DataUnavailable(Exception):
+    """GitHub injoignable ou document illisible : à distinguer d'un fichier absent"""
+
 def github_get_file(file_path):
-    """Récupère un fichier depuis GitHub via l'API Blob (pas de limite de taille)"""
+    """Récupère un fichier depuis GitHub via l'API Blob (pas de limite de taille)
+
+    None si le fichier n'existe pas ; DataUnavailable pour toute autre erreur.
+    """
     if not GITHUB_TOKEN or not GITHUB_REPO:
         return None
     
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{file_path}"
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{file_path}"
     headers = {
         "Authorization": f"token {GITHUB_TOKEN}",
         "Accept": "application/vnd.github.v3+json"
     }
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        with timed("github_get") as sample:
+            response = requests.get(url, headers=headers, timeout=10)
+            sample['bytes'] = len(response.content)
         
-        if response.status_code != 200:
+        if response.status_code == 404:
             return None
+        if response.status_code != 200:
+            raise DataUnavailable(f"{file_path} : HTTP {response.status_code}")
         
         file_info = response.json()
         sha = file_info.get('sha')
@@ -237,16 +341,18 @@ def github_get_file(file_path):
                 'sha': sha
             }
         
-        blob_url = f"https://api.github.com/repos/{GITHUB_REPO}/git/blobs/{sha}"
-        blob_response = requests.get(blob_url, headers=headers, timeout=30)
+        blob_url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/git/blobs/{sha}"
+        with timed("github_get") as sample:
+            blob_response = requests.get(blob_url, headers=headers, timeout=30)
+            sample['bytes'] = len(blob_response.content)
         
         if blob_response.status_code != 200:
-            return None
+            raise DataUnavailable(f"{file_path} (blob) : HTTP {blob_response.status_code}")
         
         blob_data = blob_response.json()
         
         if 'content' not in blob_data:
-            return None
+            raise DataUnavailable(f"{file_path} (blob) : contenu absent")
         
         encoded_content = blob_data['content'].replace('\n', '').replace('\r', '')
         decoded_content = base64.b64decode(encoded_content).decode('utf-8')
@@ -256,112 +362,704 @@ def github_get_file(file_path):
             'sha': sha
         }
         
+    except DataUnavailable:
+        raise
     except Exception as e:
-        return None
+        raise DataUnavailable(f"{file_path} : {e}") from e
 
-def load_counters():
-    """Charge les compteurs depuis GitHub"""
-    file_data = github_get_file(DATA_FILE)
+class Base64Reader:
+    """Fichier en lecture qui décode du base64 par blocs, sans copie complète"""
+    
+    def __init__(self, text, chunk_size=65536):
+        self._text = text
+        self._pos = 0
+        self._carry = ""
+        self._buffer = bytearray()
+        self._chunk_size = chunk_size
+    
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and self._pos < len(self._text):
+            chunk = self._carry + self._text[self._pos:self._pos + self._chunk_size].replace('\n', '').replace('\r', '')
+            self._pos += self._chunk_size
+            usable = len(chunk) - len(chunk) % 4
+            self._carry = chunk[usable:]
+            self._buffer += base64.b64decode(chunk[:usable])
+        
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
     
-    if file_data:
-        try:
-            data = json.loads(file_data['content'])
-            return data.get('counters', {"admin": 0, "user": 0})
-        except:
-            pass
-    return {"admin": 0, "user": 0}
+    def close(self):
+        self._text = ""
+        self._buffer.clear()
 
-def load_messages():
-    """Charge les messages depuis GitHub"""
+def github_open_file(file_path):
+    """Ouvre un fichier GitHub en flux : renvoie {'stream', 'sha'} sans tout décoder en mémoire
+
+    None si le fichier n'existe pas ; DataUnavailable pour toute autre erreur.
+    """
+    if not GITHUB_TOKEN or not GITHUB_REPO:
+        return None
+    
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{file_path}"
+    headers = {
+        "Authorization": f"token {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    
     try:
-        file_data = github_get_file(DATA_FILE)
+        with timed("github_get") as sample:
+            response = requests.get(url, headers=headers, timeout=10)
+            sample['bytes'] = len(response.content)
+        
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise DataUnavailable(f"{file_path} : HTTP {response.status_code}")
         
-        if not file_data:
-            return []
+        file_info = response.json()
+        sha = file_info.get('sha')
+        size = file_info.get('size', 0)
         
-        content = file_data['content']
+        if size < 900000 and 'content' in file_info and file_info['content']:
+            return {
+                'stream': Base64Reader(file_info['content']),
+                'sha': sha
+            }
         
-        if not content or content.strip() == "":
-            return []
+        # Le type raw renvoie le blob brut : ni enveloppe JSON ni base64 à décoder
+        blob_url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/git/blobs/{sha}"
+        raw_headers = dict(headers, Accept="application/vnd.github.raw+json")
+        with timed("github_get") as sample:
+            blob_response = requests.get(blob_url, headers=raw_headers, timeout=30, stream=True)
+            sample['bytes'] = size
         
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError as e:
-            return []
+        if blob_response.status_code != 200:
+            blob_response.close()
+            raise DataUnavailable(f"{file_path} (blob) : HTTP {blob_response.status_code}")
         
-        messages_data = data.get('messages', [])
+        blob_response.raw.decode_content = True
+        return {
+            'stream': blob_response.raw,
+            'sha': sha
+        }
         
-        messages = []
-        for idx, msg in enumerate(messages_data):
-            try:
-                if 'image_with_text_b64' in msg:
-                    img_data = base64.b64decode(msg['image_with_text_b64'])
-                    msg['image_with_text'] = Image.open(io.BytesIO(img_data))
-                
-                if 'original_image_b64' in msg:
-                    img_data = base64.b64decode(msg['original_image_b64'])
-                    msg['original_image'] = Image.open(io.BytesIO(img_data))
-                
-                messages.append(msg)
-                
-            except Exception as e:
-                continue
+    except DataUnavailable:
+        raise
+    except Exception as e:
+        raise DataUnavailable(f"{file_path} : {e}") from e
+
+def github_get_sha(file_path):
+    """Récupère uniquement le sha courant d'un fichier (nécessaire pour l'écrire)"""
+    if not GITHUB_TOKEN or not GITHUB_REPO:
+        return None
+    
+    url = f"{GITHUB_API_URL}/repos/{GITHUB_REPO}/contents/{file_path}"
+    headers = {
+        "Authorization": f"token {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    
+    try:
+        with timed("github_get") as sample:
+            response = requests.get(url, headers=headers, timeout=10)
+            sample['bytes'] = len(response.content)
+        
+        if response.status_code != 200:
+            return None
         
-        return messages
+        return response.json().get('sha')
         
     except Exception as e:
-        return []
+        return None
 
-def save_messages():
-    """Sauvegarde les messages sur GitHub"""
+def decode_message_images(msg):
+    """Remplace les images base64 d'un message par des images PIL"""
+    if 'image_with_text_b64' in msg:
+        img_data = base64.b64decode(msg.pop('image_with_text_b64'))
+        msg['image_with_text'] = Image.open(io.BytesIO(img_data))
+        msg['image_with_text_bytes'] = img_data
+    
+    if 'original_image_b64' in msg:
+        img_data = base64.b64decode(msg.pop('original_image_b64'))
+        msg['original_image'] = Image.open(io.BytesIO(img_data))
+        msg['original_image_bytes'] = img_data
+    
+    return msg
+
+def message_image_bytes(msg, field):
+    """Octets encodés d'une image du message (PNG si encodée ici), gardés sur le message"""
+    if f'{field}_bytes' not in msg:
+        img_bytes = io.BytesIO()
+        msg[field].save(img_bytes, format='PNG', optimize=False, compress_level=0)
+        msg[f'{field}_bytes'] = img_bytes.getvalue()
+    return msg[f'{field}_bytes']
+
+def message_image_type(msg, field):
+    """Extension et type MIME d'une image du message (PNG, ou JPEG après recompression)"""
+    if getattr(msg[field], 'format', None) == 'JPEG':
+        return 'jpg', 'image/jpeg'
+    return 'png', 'image/png'
+
+def feed_image_bytes(msg):
+    """Version compressée de l'image légendée pour le fil : JPEG, ou l'original s'il l'est déjà"""
+    if message_image_type(msg, 'image_with_text')[0] == 'jpg':
+        return message_image_bytes(msg, 'image_with_text')
+    # Décodée depuis les octets plutôt que depuis l'image PIL, partagée entre sessions et chargée paresseusement
+    source = Image.open(io.BytesIO(message_image_bytes(msg, 'image_with_text')))
+    encoded = io.BytesIO()
+    source.convert('RGB').save(encoded, format='JPEG', quality=FEED_JPEG_QUALITY, optimize=True)
+    return encoded.getvalue()
+
+@st.cache_resource
+def get_feed_url_key():
+    """Clé des noms de fichiers du fil, fixée pour la durée du processus
+
+    Au démarrage, le dossier public est vidé : photos de messages supprimés, fichiers .tmp
+    interrompus, noms calculés avec une ancienne clé. Les photos sont republiées à l'affichage.
+    """
+    shutil.rmtree(FEED_STATIC_DIR, ignore_errors=True)
+    return FEED_URL_KEY.encode('utf-8') if FEED_URL_KEY else os.urandom(32)
+
+def feed_image_path(msg):
+    """Chemin du fichier publié pour le fil : HMAC de l'image légendée, impossible à deviner sans la clé"""
+    digest = hmac.new(get_feed_url_key(), message_image_bytes(msg, 'image_with_text'), hashlib.sha256).hexdigest()[:32]
+    return digest, os.path.join(FEED_STATIC_DIR, f"{digest}.jpg")
+
+def feed_image_url(msg):
+    """URL statique stable de la version compressée de l'image légendée, ou None
+
+    /app/static ne vérifie pas la connexion : l'URL vaut autorisation pour qui la détient,
+    jusqu'à la suppression du message ou un changement de FEED_URL_KEY (voir le README).
+    """
+    if 'image_with_text_url' not in msg:
+        digest, path = feed_image_path(msg)
+        try:
+            # Déjà publiée par une autre session : pas de réencodage
+            if not os.path.exists(path):
+                os.makedirs(FEED_STATIC_DIR, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(feed_image_bytes(msg))
+                os.replace(tmp_path, path)
+            # Le paramètre v fait servir le fichier avec un Cache-Control longue durée
+            msg['image_with_text_url'] = f"./app/static/feed/{digest}.jpg?v={digest}"
+        except OSError:
+            msg['image_with_text_url'] = None
+    return msg['image_with_text_url']
+
+def remove_feed_image(msg):
+    """Retire du dossier public la photo d'un message supprimé"""
+    if 'image_with_text' not in msg:
+        return
+    _, path = feed_image_path(msg)
     try:
-        messages_to_save = []
-        for msg in st.session_state.messages:
-            msg_copy = {
-                'timestamp': msg['timestamp'],
-                'text': msg['text'],
-                'sender': msg['sender'],
-                'id': msg['id']
-            }
-            
-            if 'image_with_text' in msg:
-                img_bytes = io.BytesIO()
-                msg['image_with_text'].save(img_bytes, format='PNG', optimize=False, compress_level=0)
-                msg_copy['image_with_text_b64'] = base64.b64encode(img_bytes.getvalue()).decode()
+        os.remove(path)
+    except OSError:
+        pass
+
+def iter_raw_messages(stream):
+    """Parcourt les messages d'un flux JSON un par un, images encore en base64"""
+    if IJSON_AVAILABLE:
+        return ijson.items(stream, 'messages.item', use_float=True)
+    return iter(json.load(stream).get('messages', []))
+
+def iter_messages(stream):
+    """Parcourt les messages d'un flux JSON un par un, en décodant les images au passage"""
+    for msg in iter_raw_messages(stream):
+        try:
+            yield decode_message_images(msg)
+        except Exception as e:
+            continue
+
+def image_extension(data):
+    """Extension d'une image d'après ses premiers octets"""
+    if data.startswith(b'\xff\xd8'):
+        return 'jpg'
+    if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+        return 'webp'
+    return 'png'
+
+def zip_compress_type(data):
+    """Compresse l'entrée seulement si un échantillon se compresse bien (PNG non compressés)"""
+    sample = data[:65536]
+    if len(zlib.compress(sample, 1)) < len(sample) * 0.9:
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+def write_history_zip(stream, out):
+    """Écrit dans out un ZIP de tout l'historique (originaux, légendées, messages.json), une image à la fois"""
+    metadata = []
+    with zipfile.ZipFile(out, 'w') as archive:
+        for msg in iter_raw_messages(stream):
+            entry = {key: msg.get(key) for key in ('id', 'timestamp', 'sender', 'text')}
+            try:
+                date_time = datetime.fromisoformat(msg['timestamp']).timetuple()[:6]
+            except (KeyError, TypeError, ValueError):
+                date_time = (1980, 1, 1, 0, 0, 0)
             
-            if 'original_image' in msg:
-                img_bytes = io.BytesIO()
-                msg['original_image'].save(img_bytes, format='PNG', optimize=False, compress_level=0)
-                msg_copy['original_image_b64'] = base64.b64encode(img_bytes.getvalue()).decode()
+            for field, folder in (('original_image_b64', 'originaux'), ('image_with_text_b64', 'legendees')):
+                if field not in msg:
+                    continue
+                data = base64.b64decode(msg.pop(field))
+                name = f"{folder}/photo_{msg['id']}.{image_extension(data)}"
+                info = zipfile.ZipInfo(name, date_time=date_time)
+                info.compress_type = zip_compress_type(data)
+                archive.writestr(info, data)
+                entry[folder] = name
+                del data
             
-            messages_to_save.append(msg_copy)
+            metadata.append(entry)
         
-        data = {
-            'messages': messages_to_save,
-            'passwords': st.session_state.user_passwords,
-            'counters': st.session_state.counters
-        }
+        archive.writestr('messages.json', json.dumps(metadata, indent=2, ensure_ascii=False), compress_type=zipfile.ZIP_DEFLATED)
+    return len(metadata)
+
+def export_history_archive(out):
+    """Écrit dans out (fichier sur disque) l'archive ZIP de l'historique ; nombre de messages, ou None s'il n'y a pas d'historique"""
+    file_data = github_open_file(DATA_FILE)
+    if not file_data:
+        return None
+    
+    stream = file_data['stream']
+    try:
+        with timed("export") as sample:
+            count = write_history_zip(stream, out)
+            sample['bytes'] = out.tell()
+        return count
+    finally:
+        stream.close()
+
+def load_data_field(key, default):
+    """Lit un seul champ de premier niveau du fichier de données, en flux"""
+    file_data = github_open_file(DATA_FILE)
+    
+    if not file_data:
+        return default
+    
+    stream = file_data['stream']
+    try:
+        if IJSON_AVAILABLE:
+            return next(ijson.items(stream, key, use_float=True), default)
+        return json.load(stream).get(key, default)
+    except Exception:
+        return default
+    finally:
+        stream.close()
+
+def load_messages():
+    """Charge les messages depuis GitHub"""
+    return load_messages_snapshot()['messages']
+
+def load_messages_snapshot():
+    """Messages et sha du fichier lu ; liste vide et sha None s'il n'existe pas encore
+
+    DataUnavailable si la lecture échoue : une liste vide ne doit jamais remplacer l'historique.
+    """
+    with timed("snapshot_load"):
+        return _load_messages_snapshot()
+
+def _load_messages_snapshot():
+    file_data = github_open_file(DATA_FILE)
+    
+    if not file_data:
+        return {'messages': [], 'sha': None}
+    
+    stream = file_data['stream']
+    try:
+        return {'messages': list(iter_messages(stream)), 'sha': file_data['sha']}
+    except Exception as e:
+        raise DataUnavailable(f"{DATA_FILE} illisible : {e}") from e
+    finally:
+        stream.close()
+
+def fetch_messages(previous=None):
+    """Messages publiés ; réutilise le chargement précédent tant que le sha du fichier n'a pas changé"""
+    if previous is not None and previous['sha'] is not None and github_get_sha(DATA_FILE) == previous['sha']:
+        return previous
+    return load_messages_snapshot()
+
+def save_messages():
+    """Sauvegarde les messages sur GitHub"""
+    try:
+        with timed("serialization") as sample:
+            messages_to_save = []
+            for msg in st.session_state.messages:
+                msg_copy = {
+                    'timestamp': msg['timestamp'],
+                    'text': msg['text'],
+                    'sender': msg['sender'],
+                    'id': msg['id']
+                }
+                
+                if 'image_with_text' in msg:
+                    msg_copy['image_with_text_b64'] = base64.b64encode(message_image_bytes(msg, 'image_with_text')).decode()
+                
+                if 'original_image' in msg:
+                    msg_copy['original_image_b64'] = base64.b64encode(message_image_bytes(msg, 'original_image')).decode()
+                
+                messages_to_save.append(msg_copy)
+            
+            data = {'messages': messages_to_save}
+            content = json.dumps(data, indent=2)
+            sample['bytes'] = len(content)
         
-        file_data = github_get_file(DATA_FILE)
-        sha = file_data['sha'] if file_data else None
+        sha = github_get_sha(DATA_FILE)
+        # Liste de session qui ne vient d'aucune lecture réussie alors que le fichier existe : l'écrire l'effacerait
+        if sha is not None and st.session_state.get('messages_sha') is None:
+            st.error("❌ Historique non chargé : rien n'est publié, recharge depuis GitHub")
+            return False
         
-        return github_update_file(DATA_FILE, json.dumps(data, indent=2), sha, "Update messages")
+        saved = github_update_file(DATA_FILE, content, sha, "Update messages")
+        if saved:
+            st.session_state.messages_sha = saved
+            invalidate_prefetch('messages')
+        return bool(saved)
         
     except Exception as e:
         st.error(f"Erreur sauvegarde: {str(e)}")
         return False
 
-def load_passwords():
-    """Charge les mots de passe depuis GitHub"""
-    file_data = github_get_file(DATA_FILE)
+def empty_stats():
+    """Statistiques vides : totaux par expéditeur et nombre de messages par jour"""
+    return {'totals': {"admin": 0, "user": 0}, 'days': {}, 'message_count': 0, 'last_id': None}
+
+def stats_add(stats, msg):
+    """Met à jour les statistiques pour un message ajouté"""
+    sender = msg['sender']
+    day = stats['days'].setdefault(msg['timestamp'][:10], {})
+    day[sender] = day.get(sender, 0) + 1
+    stats['totals'][sender] = stats['totals'].get(sender, 0) + 1
+    stats['message_count'] += 1
+    stats['last_id'] = msg['id']
+
+def stats_remove(stats, msg, last_id=None):
+    """Met à jour les statistiques pour un message supprimé"""
+    sender = msg['sender']
+    day_key = msg['timestamp'][:10]
+    day = stats['days'].get(day_key, {})
+    if day.get(sender, 0) > 0:
+        day[sender] -= 1
+        if day[sender] == 0:
+            del day[sender]
+        if not day:
+            stats['days'].pop(day_key, None)
+    if stats['totals'].get(sender, 0) > 0:
+        stats['totals'][sender] -= 1
+    stats['message_count'] = max(0, stats['message_count'] - 1)
+    stats['last_id'] = last_id
+
+def rebuild_stats(messages):
+    """Recalcule les statistiques en un seul passage sur les métadonnées des messages"""
+    stats = empty_stats()
+    for msg in messages:
+        stats_add(stats, msg)
+    return stats
+
+def stats_match(stats, messages):
+    """Vérifie que les statistiques (totaux, jours, dernier id) correspondent exactement à la liste de messages"""
+    return stats == rebuild_stats(messages)
+
+def current_streak(stats, sender, today=None):
+    """Nombre de jours consécutifs avec au moins un message, jusqu'à aujourd'hui ou hier"""
+    day = today or date.today()
+    if not stats['days'].get(day.isoformat(), {}).get(sender):
+        day -= timedelta(days=1)
+    
+    streak = 0
+    while stats['days'].get(day.isoformat(), {}).get(sender):
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+def empty_settings():
+    """Document de réglages par défaut : mots de passe, compteurs et réglages divers"""
+    return {'version': 0, 'passwords': ["crush"], 'stats': empty_stats(), 'settings': {}}
+
+def load_settings():
+    """Charge le document de réglages (quelques centaines d'octets)
+
+    None seulement s'il n'existe pas ; DataUnavailable si GitHub échoue ou si le document est illisible.
+    """
+    file_data = github_get_file(SETTINGS_FILE)
+    if file_data is None:
+        return None
     
-    if file_data:
-        try:
-            data = json.loads(file_data['content'])
-            return data.get('passwords', ["crush"])
-        except:
-            pass
-    return ["crush"]
+    try:
+        settings = empty_settings()
+        settings.update(json.loads(file_data['content']))
+        settings['stats'] = {**empty_stats(), **settings['stats']}
+    except (ValueError, TypeError) as e:
+        raise DataUnavailable(f"{SETTINGS_FILE} illisible : {e}") from e
+    settings['sha'] = file_data['sha']
+    return settings
+
+def update_settings(change):
+    """Relit les réglages, applique change(settings) et republie ; recommence si un autre écrivain est passé entre-temps
+
+    Si change renvoie False, rien n'est écrit et les réglages relus sont renvoyés tels quels.
+    """
+    for _ in range(SETTINGS_WRITE_ATTEMPTS):
+        settings = load_settings() or empty_settings()
+        if change(settings) is False:
+            return settings
+        settings['version'] += 1
+        content = json.dumps({key: value for key, value in settings.items() if key != 'sha'}, indent=2)
+        if github_update_file(SETTINGS_FILE, content, settings.get('sha'), f"Update settings (v{settings['version']})"):
+            invalidate_prefetch('settings')
+            return settings
+    return None
+
+def strip_legacy_fields():
+    """Réécrit le fichier de données sans les anciens champs passwords / counters, une fois migrés"""
+    file_data = github_open_file(DATA_FILE)
+    if not file_data:
+        return False
+    
+    stream = file_data['stream']
+    try:
+        messages = list(iter_raw_messages(stream))
+    finally:
+        stream.close()
+    content = json.dumps({'messages': messages}, indent=2)
+    return github_update_file(DATA_FILE, content, file_data['sha'], "Move passwords to settings")
+
+def fetch_settings(previous=None):
+    """Réglages publiés (toujours relus : le document est petit) ; s'ils n'existent pas encore, reprend les mots de passe de l'ancien fichier de données"""
+    settings = load_settings()
+    if settings is not None:
+        return settings
+    
+    # Migration : uniquement quand le document est absent (404), jamais sur une erreur de lecture
+    settings = empty_settings()
+    legacy_passwords = load_data_field('passwords', None)
+    if legacy_passwords is not None:
+        settings['passwords'] = legacy_passwords
+        migrated = update_settings(lambda current: current.update(passwords=legacy_passwords))
+        if migrated:
+            settings = migrated
+            try:
+                strip_legacy_fields()
+            except DataUnavailable:
+                # Champs laissés dans le fichier de données : ils ne sont plus jamais relus
+                pass
+    return settings
+
+def save_stats(apply=None):
+    """Publie les statistiques dans le document de réglages
+
+    apply(stats) rejoue un ajout ou une suppression sur les statistiques fraîchement relues,
+    pour ne pas écraser les envois concurrents (False : rien à publier) ; sans apply, la copie
+    de la session est publiée telle quelle.
+    """
+    def change(settings):
+        if apply is None:
+            settings['stats'] = st.session_state.stats
+        else:
+            return apply(settings['stats'])
+    
+    try:
+        settings = update_settings(change)
+    except Exception as e:
+        st.error(f"Erreur sauvegarde statistiques: {str(e)}")
+        return False
+    if settings:
+        st.session_state.stats = copy.deepcopy(settings['stats'])
+        st.session_state.settings_version = settings['version']
+    return settings is not None
+
+def sync_stats(messages, sha):
+    """Reconstruit les statistiques si elles ne correspondent plus aux messages
+
+    Le résumé publié n'est remplacé que si la liste vient du fichier de données courant (sha)
+    et qu'il diverge encore une fois relu : un préchargement périmé n'écrase pas les envois récents.
+    """
+    if stats_match(st.session_state.stats, messages):
+        return
+    rebuilt = rebuild_stats(messages)
+    st.session_state.stats = copy.deepcopy(rebuilt)
+    if sha is None:
+        return
+    
+    def republish(stats):
+        if stats_match(stats, messages) or github_get_sha(DATA_FILE) != sha:
+            return False
+        stats.clear()
+        stats.update(rebuilt)
+    
+    save_stats(republish)
+
+def caption_words(text):
+    """Mots d'une légende, normalisés pour l'index inversé"""
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+def message_key(msg):
+    """Clé de tri chronologique d'un message"""
+    return (msg['timestamp'], msg['id'])
+
+def build_message_index(messages):
+    """Construit les index (id, expéditeur, date, mots) ; trie la liste chronologiquement sur place"""
+    messages.sort(key=message_key)
+    index = {'by_id': {}, 'by_sender': {}, 'by_time': [], 'words': {}, 'word_list': []}
+    for msg in messages:
+        key = message_key(msg)
+        index['by_id'][msg['id']] = msg
+        index['by_sender'].setdefault(msg['sender'], []).append(key)
+        index['by_time'].append(key)
+        for word in caption_words(msg['text']):
+            index['words'].setdefault(word, set()).add(msg['id'])
+    # Mots triés : la recherche par début de mot est une plage de bisect
+    index['word_list'] = sorted(index['words'])
+    return index
+
+def index_add(index, messages, msg):
+    """Insère un message dans la liste et dans les index"""
+    key = message_key(msg)
+    pos = bisect_right(index['by_time'], key)
+    index['by_time'].insert(pos, key)
+    messages.insert(pos, msg)
+    index['by_id'][msg['id']] = msg
+    sender_keys = index['by_sender'].setdefault(msg['sender'], [])
+    sender_keys.insert(bisect_right(sender_keys, key), key)
+    for word in caption_words(msg['text']):
+        if word not in index['words']:
+            index['words'][word] = set()
+            insort(index['word_list'], word)
+        index['words'][word].add(msg['id'])
+
+def index_remove(index, messages, msg):
+    """Retire un message de la liste et des index, sans parcourir l'historique"""
+    key = message_key(msg)
+    pos = bisect_left(index['by_time'], key)
+    del index['by_time'][pos]
+    del messages[pos]
+    del index['by_id'][msg['id']]
+    sender_keys = index['by_sender'][msg['sender']]
+    del sender_keys[bisect_left(sender_keys, key)]
+    for word in caption_words(msg['text']):
+        ids = index['words'].get(word)
+        if ids is not None:
+            ids.discard(msg['id'])
+            if not ids:
+                del index['words'][word]
+                del index['word_list'][bisect_left(index['word_list'], word)]
+
+def words_with_prefix(index, prefix):
+    """Ids des messages dont un mot de légende commence par prefix"""
+    word_list = index['word_list']
+    ids = set()
+    for pos in range(bisect_left(word_list, prefix), len(word_list)):
+        if not word_list[pos].startswith(prefix):
+            break
+        ids |= index['words'][word_list[pos]]
+    return ids
+
+def filter_messages(index, sender=None, start=None, end=None, text=""):
+    """Messages correspondant aux filtres, dans l'ordre chronologique, via les index"""
+    lo = (start.isoformat(),) if start else None
+    hi = ((end + timedelta(days=1)).isoformat(),) if end else None
+    words = caption_words(text)
+    
+    if words:
+        id_sets = sorted((words_with_prefix(index, word) for word in words), key=len)
+        ids = set.intersection(*id_sets)
+        keys = sorted(message_key(index['by_id'][msg_id]) for msg_id in ids)
+        keys = [
+            k for k in keys
+            if (lo is None or k >= lo) and (hi is None or k < hi)
+            and (sender is None or index['by_id'][k[1]]['sender'] == sender)
+        ]
+    else:
+        keys = index['by_sender'].get(sender, []) if sender else index['by_time']
+        keys = keys[bisect_left(keys, lo) if lo else 0:bisect_left(keys, hi) if hi else len(keys)]
+    
+    return [index['by_id'][msg_id] for _, msg_id in keys]
+
+PREFETCH_LOADERS = {'settings': fetch_settings, 'messages': fetch_messages}
+
+@st.cache_resource
+def get_prefetch_state():
+    """Chargement en arrière-plan des réglages et des messages, partagé entre les sessions"""
+    return {
+        'lock': threading.Lock(),
+        'futures': {},
+        'started': {},
+        # Un thread par document : les réglages n'attendent jamais un téléchargement de photos
+        'executors': {part: ThreadPoolExecutor(max_workers=1) for part in PREFETCH_LOADERS}
+    }
+
+def _refresh_part(part, previous):
+    """Recharge un document en repartant du résultat précédent (le worker l'a déjà terminé)"""
+    try:
+        previous_result = previous.result() if previous is not None else None
+    except Exception:
+        previous_result = None
+    return PREFETCH_LOADERS[part](previous_result)
+
+def _submit_refresh(state, part):
+    state['futures'][part] = state['executors'][part].submit(_refresh_part, part, state['futures'].get(part))
+    state['started'][part] = time.time()
+
+def prefetch_history(*parts):
+    """Relance les documents demandés (tous par défaut) absents, en échec ou de plus de PREFETCH_TTL_SECONDS"""
+    state = get_prefetch_state()
+    with state['lock']:
+        for part in parts or PREFETCH_LOADERS:
+            future = state['futures'].get(part)
+            if future is None:
+                _submit_refresh(state, part)
+            elif future.done():
+                stale = time.time() - state['started'][part] >= PREFETCH_TTL_SECONDS
+                if stale or future.exception() is not None:
+                    _submit_refresh(state, part)
+        return dict(state['futures'])
+
+def invalidate_prefetch(*parts):
+    """Périme les documents indiqués (tous par défaut) après une écriture ou un rechargement demandé"""
+    state = get_prefetch_state()
+    with state['lock']:
+        for part in parts or PREFETCH_LOADERS:
+            future = state['futures'].get(part)
+            if future is None:
+                continue
+            if future.done():
+                state['started'][part] = 0.0
+            else:
+                # Lecture en cours peut-être antérieure à l'écriture : une relecture passe derrière
+                _submit_refresh(state, part)
+
+def get_user_passwords():
+    """Mots de passe utilisateur : seuls les réglages sont rafraîchis, jamais l'historique"""
+    if 'user_passwords' in st.session_state:
+        return st.session_state.user_passwords
+    return prefetch_history('settings')['settings'].result()['passwords']
+
+def adopt_history():
+    """Installe dans la session les réglages et messages préchargés, en attendant la fin du téléchargement si besoin"""
+    futures = prefetch_history()
+    try:
+        settings = futures['settings'].result()
+    except DataUnavailable:
+        st.warning("⚠️ Réglages indisponibles : mots de passe et compteurs par défaut pour l'instant")
+        settings = empty_settings()
+    # Liste, dicts de message et statistiques copiés : la session les modifie sur place (URL du fil,
+    # octets encodés...). Les images PIL restent partagées avec le préchargement et ne sont que lues.
+    try:
+        snapshot = futures['messages'].result()
+    except DataUnavailable:
+        # sha None : save_messages refusera d'écrire tant qu'un rechargement n'a pas réussi
+        st.warning("⚠️ Historique indisponible pour l'instant : recharge depuis GitHub avant d'envoyer")
+        snapshot = {'messages': [], 'sha': None}
+    st.session_state.messages_sha = snapshot['sha']
+    st.session_state.messages = [dict(msg) for msg in snapshot['messages']]
+    st.session_state.message_index = build_message_index(st.session_state.messages)
+    st.session_state.user_passwords = list(settings['passwords'])
+    st.session_state.stats = copy.deepcopy(settings['stats'])
+    st.session_state.settings_version = settings['version']
+    sync_stats(st.session_state.messages, snapshot['sha'])
 
 def send_telegram_notification(sender, has_text):
     """Envoie une notification Telegram au groupe"""
@@ -418,11 +1116,13 @@ def send_telegram_notification(sender, has_text):
         else:
             base_message = random.choice(messages_admin)
         
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        response = requests.post(url, json={
-            "chat_id": TELEGRAM_GROUP_CHAT_ID,
-            "text": base_message
-        }, timeout=5)
+        url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+        with timed("telegram_send") as sample:
+            response = requests.post(url, json={
+                "chat_id": TELEGRAM_GROUP_CHAT_ID,
+                "text": base_message
+            }, timeout=5)
+            sample['bytes'] = len(response.request.body or b"")
         
         return response.status_code == 200
     except:
@@ -462,28 +1162,98 @@ if 'libs_checked' not in st.session_state:
     if not CV2_AVAILABLE or not MEDIAPIPE_AVAILABLE:
         reload_heavy_libraries()
     st.session_state.libs_checked = True
-if 'messages' not in st.session_state:
-    st.session_state.messages = load_messages()
-if 'user_passwords' not in st.session_state:
-    st.session_state.user_passwords = load_passwords()
 if 'last_message_count' not in st.session_state:
     st.session_state.last_message_count = 0
 if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 if 'notification_enabled' not in st.session_state:
     st.session_state.notification_enabled = False
-if 'counters' not in st.session_state:
-    st.session_state.counters = load_counters()
 
-def verify_human_body_simple(image):
+def ingest_photo(photo_file):
+    """Décode une photo une seule fois : orientation EXIF, RGB, grand côté limité à MAX_IMAGE_EDGE"""
+    with timed("image_decode") as sample:
+        sample['bytes'] = getattr(photo_file, 'size', 0)
+        image = Image.open(photo_file)
+        # Pour un JPEG, décode directement à une échelle réduite proche de la cible
+        image.draft('RGB', (MAX_IMAGE_EDGE, MAX_IMAGE_EDGE))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if max(image.size) > MAX_IMAGE_EDGE:
+            image.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+        image.load()
+    
+    photo = {'image': image, 'rgb': None, 'gray': None}
+    if CV2_AVAILABLE:
+        photo['rgb'] = np.asarray(image)
+        photo['gray'] = cv2.cvtColor(photo['rgb'], cv2.COLOR_RGB2GRAY)
+        thumb = cv2.resize(photo['gray'], (9, 8), interpolation=cv2.INTER_AREA).flatten().tolist()
+    else:
+        thumb = list(image.convert('L').resize((9, 8), Image.BILINEAR).getdata())
+    photo['dhash'] = difference_hash(thumb)
+    return photo
+
+def difference_hash(pixels):
+    """Empreinte perceptuelle 64 bits (dHash) d'une vignette 9x8 en niveaux de gris"""
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+@st.cache_resource
+def get_recent_photo_hashes():
+    """Empreintes des photos récemment envoyées par expéditeur, partagées entre les sessions"""
+    return {'by_sender': {}, 'lock': threading.Lock()}
+
+def claim_photo(sender, photo_hash):
+    """Enregistre l'empreinte d'une photo à envoyer ; False si une quasi-copie vient d'être envoyée"""
+    recent = get_recent_photo_hashes()
+    now = time.time()
+    with recent['lock']:
+        entries = recent['by_sender'].setdefault(sender, deque())
+        while entries and now - entries[0][0] > DUPLICATE_WINDOW_SECONDS:
+            entries.popleft()
+        
+        for _, known_hash in entries:
+            if (known_hash ^ photo_hash).bit_count() <= DUPLICATE_HASH_THRESHOLD:
+                return False
+        
+        entries.append((now, photo_hash))
+        return True
+
+def release_photo(sender, photo_hash):
+    """Rend une empreinte réservée par claim_photo quand l'envoi a échoué"""
+    recent = get_recent_photo_hashes()
+    with recent['lock']:
+        entries = recent['by_sender'].get(sender, deque())
+        for entry in reversed(entries):
+            if entry[1] == photo_hash:
+                entries.remove(entry)
+                break
+
+def get_ingested_photo(camera_photo):
+    """Renvoie la photo normalisée, recalculée seulement quand la caméra change"""
+    key = getattr(camera_photo, 'file_id', None) or id(camera_photo)
+    cached = st.session_state.get('ingested_photo')
+    if cached is None or cached['key'] != key:
+        cached = ingest_photo(camera_photo)
+        cached['key'] = key
+        cached['has_human'] = None
+        st.session_state.ingested_photo = cached
+    return cached
+
+def verify_human_body_simple(image, rgb=None, gray=None):
     """Vérifie la présence d'un corps humain avec OpenCV + MediaPipe"""
     if not CV2_AVAILABLE:
         return True
     
     try:
-        img_array = np.array(image)
-        img_bgr = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        img_array = rgb if rgb is not None else np.array(image.convert('RGB'))
+        if gray is None:
+            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
         
         detections = []
         
@@ -498,8 +1268,10 @@ def verify_human_body_simple(image):
         
         for cascade_name, min_neighbors, min_size in cascades:
             try:
-                cascade = cv2.CascadeClassifier(cv2.data.haarcascades + cascade_name)
-                objects = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=min_neighbors, minSize=(min_size, min_size))
+                detector = cascade_name.replace('haarcascade_', '').replace('.xml', '')
+                with timed(f"detection:{detector}"):
+                    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + cascade_name)
+                    objects = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=min_neighbors, minSize=(min_size, min_size))
                 if len(objects) > 0:
                     detections.append(cascade_name)
             except:
@@ -508,7 +1280,7 @@ def verify_human_body_simple(image):
         if MEDIAPIPE_AVAILABLE:
             try:
                 mp_hands = mp.solutions.hands
-                with mp_hands.Hands(static_image_mode=True, max_num_hands=2, min_detection_confidence=0.5) as hands:
+                with timed("detection:hands"), mp_hands.Hands(static_image_mode=True, max_num_hands=2, min_detection_confidence=0.5) as hands:
                     results = hands.process(img_array)
                     if results.multi_hand_landmarks:
                         detections.append('hands')
@@ -517,7 +1289,7 @@ def verify_human_body_simple(image):
             
             try:
                 mp_pose = mp.solutions.pose
-                with mp_pose.Pose(static_image_mode=True, min_detection_confidence=0.5) as pose:
+                with timed("detection:pose"), mp_pose.Pose(static_image_mode=True, min_detection_confidence=0.5) as pose:
                     results = pose.process(img_array)
                     if results.pose_landmarks:
                         detections.append('pose')
@@ -540,6 +1312,10 @@ def add_text_to_image(image, text):
     if not text or text.strip() == "":
         return image
     
+    with timed("overlay_render"):
+        return _render_text_overlay(image, text)
+
+def _render_text_overlay(image, text):
     scale_factor = 3
     img_copy = image.copy()
     original_size = img_copy.size
@@ -686,10 +1462,9 @@ def add_text_to_image(image, text):
     
     return img_copy
 
-def increment_counter(user):
-    """Incrémente le compteur de l'utilisateur avec animation"""
-    st.session_state.counters[user] = st.session_state.counters.get(user, 0) + 1
-    counter_value = st.session_state.counters[user]
+def celebrate_message(user):
+    """Animation d'envoi, avec une fête tous les 5 et 10 messages"""
+    counter_value = st.session_state.stats['totals'].get(user, 0)
     
     st.balloons()
     
@@ -700,7 +1475,7 @@ def increment_counter(user):
         st.success(f"🌟 **{counter_value} messages** ! Continue comme ça ! 🌟")
 
 def save_message(image, text, original_image, sender):
-    """Sauvegarde un message"""
+    """Sauvegarde un message ; False (et rien de changé dans la session) si l'écriture GitHub échoue"""
     message = {
         'timestamp': datetime.now().isoformat(),
         'text': text,
@@ -709,30 +1484,34 @@ def save_message(image, text, original_image, sender):
         'sender': sender,
         'id': int(datetime.now().timestamp() * 1000)
     }
-    st.session_state.messages.append(message)
-    increment_counter(sender)
-    save_messages()
+    messages = st.session_state.messages
+    index_add(st.session_state.message_index, messages, message)
+    stats_add(st.session_state.stats, message)
+    
+    if not save_messages():
+        index_remove(st.session_state.message_index, messages, message)
+        stats_remove(st.session_state.stats, message, messages[-1]['id'] if messages else None)
+        return False
+    
+    save_stats(lambda stats: stats_add(stats, message))
+    celebrate_message(sender)
     send_telegram_notification(sender, bool(text))
+    return True
 
 def delete_message(message_id):
     """Supprime un message et décrémente le compteur"""
-    # Trouver le message à supprimer pour récupérer l'expéditeur
-    message_to_delete = None
-    for msg in st.session_state.messages:
-        if msg['id'] == message_id:
-            message_to_delete = msg
-            break
+    message_to_delete = st.session_state.message_index['by_id'].get(message_id)
     
-    # Supprimer le message
-    st.session_state.messages = [msg for msg in st.session_state.messages if msg['id'] != message_id]
-    
-    # Décrémenter le compteur de l'expéditeur
+    # Supprimer le message et mettre à jour les statistiques de l'expéditeur
     if message_to_delete:
-        sender = message_to_delete['sender']
-        if sender in st.session_state.counters and st.session_state.counters[sender] > 0:
-            st.session_state.counters[sender] -= 1
-    
-    save_messages()
+        messages = st.session_state.messages
+        index_remove(st.session_state.message_index, messages, message_to_delete)
+        stats_remove(st.session_state.stats, message_to_delete, messages[-1]['id'] if messages else None)
+    
+    if save_messages() and message_to_delete:
+        last_id = messages[-1]['id'] if messages else None
+        save_stats(lambda stats: stats_remove(stats, message_to_delete, last_id))
+        remove_feed_image(message_to_delete)
 
 def check_new_messages():
     """Vérifie les nouveaux messages"""
@@ -782,28 +1561,38 @@ def display_counters():
             font-size: 0.9rem;
             margin-top: 0.3rem;
         }
+        .counter-streak {
+            color: rgba(255,255,255,0.7);
+            text-align: center;
+            font-size: 0.8rem;
+            margin-top: 0.2rem;
+        }
     </style>
     """, unsafe_allow_html=True)
     
+    stats = st.session_state.stats
+    today = stats['days'].get(date.today().isoformat(), {})
     col1, col2 = st.columns(2)
     
     with col1:
-        admin_count = st.session_state.counters.get("admin", 0)
+        admin_count = stats['totals'].get("admin", 0)
         st.markdown(f"""
         <div class="counter-container">
             <div class="counter-title">Le grand, beau, magnifique, merveilleux, grandiose, splendide, humble cousin</div>
             <div class="counter-value">{admin_count}</div>
             <div class="counter-label">messages envoyés</div>
+            <div class="counter-streak">🔥 {current_streak(stats, "admin")} j d'affilée · {today.get("admin", 0)} aujourd'hui</div>
         </div>
         """, unsafe_allow_html=True)
     
     with col2:
-        user_count = st.session_state.counters.get("user", 0)
+        user_count = stats['totals'].get("user", 0)
         st.markdown(f"""
         <div class="counter-container">
             <div class="counter-title">La cousine 😘</div>
             <div class="counter-value">{user_count}</div>
             <div class="counter-label">messages envoyés</div>
+            <div class="counter-streak">🔥 {current_streak(stats, "user")} j d'affilée · {today.get("user", 0)} aujourd'hui</div>
         </div>
         """, unsafe_allow_html=True)
 
@@ -823,37 +1612,113 @@ def login_page():
                 st.session_state.authenticated = True
                 st.session_state.is_admin = True
                 st.session_state.current_user = "admin"
-                st.session_state.last_message_count = len(st.session_state.messages)
-                st.rerun()
-            elif password in st.session_state.user_passwords:
-                st.session_state.authenticated = True
-                st.session_state.is_admin = False
-                st.session_state.current_user = "user"
+                adopt_history()
                 st.session_state.last_message_count = len(st.session_state.messages)
                 st.rerun()
             else:
-                st.error("❌ Code incorrect")
+                try:
+                    accepted = bool(password) and password in get_user_passwords()
+                except DataUnavailable:
+                    accepted = None
+                    st.error("❌ Réglages indisponibles, réessaie dans un instant")
+                
+                if accepted:
+                    st.session_state.authenticated = True
+                    st.session_state.is_admin = False
+                    st.session_state.current_user = "user"
+                    adopt_history()
+                    st.session_state.last_message_count = len(st.session_state.messages)
+                    st.rerun()
+                elif accepted is not None:
+                    st.error("❌ Code incorrect")
+    
+    # L'historique se télécharge pendant la saisie du code ; ensuite seul son sha est revérifié
+    prefetch_history()
+
+def display_latency_panel():
+    """Affiche les latences récentes par phase et les exports de mesures"""
+    st.write("### ⏱️ Latences")
+    rows = metrics_summary()
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+    else:
+        st.caption("Aucune mesure pour le moment")
+    
+    st.download_button("📄 Mesures (JSON lines)", metrics_jsonl(), "metrics.jsonl", "application/json", key="dl_metrics")
+    
+    if st.button("🧪 Profiler le prochain rerun"):
+        st.session_state.profile_next_rerun = True
+        st.rerun()
+    
+    if st.session_state.get('profile_dump'):
+        st.download_button("📄 Profil cProfile", st.session_state.profile_dump, "rerun.prof", "application/octet-stream", key="dl_profile")
+
+def apply_password_change(change):
+    """Publie un changement de mots de passe dans le document de réglages, sans toucher aux photos"""
+    try:
+        settings = update_settings(change)
+    except DataUnavailable:
+        settings = None
+    if settings is None:
+        st.toast("❌ Échec de la sauvegarde des mots de passe")
+        return False
+    st.session_state.user_passwords = list(settings['passwords'])
+    st.session_state.settings_version = settings['version']
+    return True
+
+def remove_password(pwd):
+    """Callback : supprime un mot de passe utilisateur"""
+    def change(settings):
+        if pwd in settings['passwords']:
+            settings['passwords'].remove(pwd)
+    
+    apply_password_change(change)
 
+def add_password():
+    """Callback : ajoute le mot de passe saisi s'il est nouveau"""
+    new_pwd = st.session_state.new_pwd
+    if new_pwd and new_pwd not in st.session_state.user_passwords:
+        def change(settings):
+            if new_pwd not in settings['passwords']:
+                settings['passwords'].append(new_pwd)
+        
+        if apply_password_change(change):
+            st.toast("✅ Ajouté")
+
+@st.fragment
 def admin_panel():
-    """Panel admin"""
-    st.sidebar.title("Panel Admin")
-    st.sidebar.subheader("Mots de passe")
+    """Panel admin (à appeler dans la barre latérale)"""
+    st.title("Panel Admin")
+    st.subheader("Mots de passe")
     
+    # Callbacks : la liste est modifiée avant le rerun du fragment, sans st.rerun()
     for idx, pwd in enumerate(st.session_state.user_passwords):
-        col1, col2 = st.sidebar.columns([3, 1])
+        col1, col2 = st.columns([3, 1])
         col1.text(pwd)
-        if col2.button("🗑️", key=f"del_pwd_{idx}"):
-            st.session_state.user_passwords.pop(idx)
-            save_messages()
-            st.rerun()
+        col2.button("🗑️", key=f"del_pwd_{idx}", on_click=remove_password, args=(pwd,))
     
-    new_pwd = st.sidebar.text_input("Nouveau mot de passe", key="new_pwd")
-    if st.sidebar.button("➕ Ajouter"):
-        if new_pwd and new_pwd not in st.session_state.user_passwords:
-            st.session_state.user_passwords.append(new_pwd)
-            save_messages()
-            st.sidebar.success("✅ Ajouté")
-            st.rerun()
+    st.text_input("Nouveau mot de passe", key="new_pwd")
+    st.button("➕ Ajouter", on_click=add_password)
+    
+    st.subheader("Export")
+    if st.button("📦 Exporter tout l'historique"):
+        # Archive sur disque, jamais gardée dans la session : le bouton n'existe que pour ce rerun
+        with tempfile.TemporaryFile() as out:
+            try:
+                with st.spinner("Préparation de l'archive..."):
+                    count = export_history_archive(out)
+            except Exception as e:
+                st.error(f"❌ Export impossible : {e}")
+            else:
+                if count is None:
+                    st.error("❌ Historique introuvable sur GitHub")
+                else:
+                    out.flush()
+                    # st.download_button n'accepte qu'un BufferedReader : le ZIP y est lu une fois,
+                    # copié dans le stockage de médias de la session (jamais /app/static)
+                    with open(out.fileno(), 'rb', closefd=False) as archive:
+                        st.download_button("📥 Télécharger l'archive (ZIP)", archive, "messagerie_photo.zip", "application/zip", key="dl_export")
+                    st.caption(f"{count} messages · le bouton disparaît à la prochaine action, relancer l'export si besoin")
 
 def main_app():
     """Application principale"""
@@ -902,9 +1767,13 @@ def main_app():
         st.write("### 📊 État du système")
         st.write(f"Messages en mémoire : **{len(st.session_state.messages)}**")
         st.write(f"GitHub : **{'✅ Configuré' if GITHUB_TOKEN and GITHUB_REPO else '❌ Non configuré'}**")
+        st.write(f"Réglages : **v{st.session_state.get('settings_version', 0)}**")
         st.write(f"OpenCV : **{'✅' if CV2_AVAILABLE else '❌'}**")
         st.write(f"MediaPipe : **{'✅' if MEDIAPIPE_AVAILABLE else '❌'}**")
 
+        if st.session_state.is_admin:
+            display_latency_panel()
+
         if not CV2_AVAILABLE or not MEDIAPIPE_AVAILABLE:
             st.warning("⚠️ Bibliothèques non chargées")
             if st.button("🔄 Recharger les bibliothèques"):
@@ -916,9 +1785,8 @@ def main_app():
                         st.error("❌ Échec du rechargement")
         
         if st.button("🔄 Recharger depuis GitHub"):
-            st.session_state.messages = load_messages()
-            st.session_state.user_passwords = load_passwords()
-            st.session_state.counters = load_counters()
+            invalidate_prefetch()
+            adopt_history()
             st.rerun()
     
     check_new_messages()
@@ -932,19 +1800,35 @@ def main_app():
             st.rerun()
     
     if st.session_state.is_admin:
-        admin_panel()
+        with st.sidebar:
+            admin_panel()
+    
+    composer()
+    
+    st.header("💬 Messages")
     
+    if st.session_state.messages:
+        feed()
+    else:
+        st.info("Aucun message")
+
+@st.fragment
+def composer():
+    """Photo, vérification, légende et envoi : une frappe ne relance que cette partie"""
     st.header("📤 Nouveau message")
     
     camera_photo = st.camera_input("📸 Prendre une photo", label_visibility="collapsed")
     
     if camera_photo is not None:
-        image = Image.open(camera_photo)
+        photo = get_ingested_photo(camera_photo)
+        image = photo['image']
         
-        has_human = True
-        if CV2_AVAILABLE:
-            with st.spinner("🔍 Vérification..."):
-                has_human = verify_human_body_simple(image)
+        if photo['has_human'] is None:
+            photo['has_human'] = True
+            if CV2_AVAILABLE:
+                with st.spinner("🔍 Vérification..."):
+                    photo['has_human'] = verify_human_body_simple(image, photo['rgb'], photo['gray'])
+        has_human = photo['has_human']
         
         if not has_human:
             st.error("❌ La photo doit contenir une partie du corps humain")
@@ -952,41 +1836,104 @@ def main_app():
             text_input = st.text_input("", key="text_msg", placeholder="💬 Ajouter un message...", label_visibility="collapsed")
             
             if st.button("✉️ Envoyer", type="primary", use_container_width=True):
-                image_with_text = add_text_to_image(image, text_input) if text_input else image
-                save_message(image_with_text, text_input, image, st.session_state.current_user)
-                st.success("✅ Envoyé !")
+                if not claim_photo(st.session_state.current_user, photo['dhash']):
+                    st.warning("⚠️ Cette photo vient déjà d'être envoyée")
+                else:
+                    sent = False
+                    try:
+                        image_with_text = add_text_to_image(image, text_input) if text_input else image
+                        sent = save_message(image_with_text, text_input, image, st.session_state.current_user)
+                    finally:
+                        # Échec ou exception : l'empreinte est rendue, renvoyer la même photo reste possible
+                        if not sent:
+                            release_photo(st.session_state.current_user, photo['dhash'])
+                    
+                    if sent:
+                        st.success("✅ Envoyé !")
+                        # Compteurs et fil changent aussi : rerun de toute la page
+                        st.rerun()
+                    else:
+                        st.error("❌ Échec de l'envoi, réessaie")
+
+@st.fragment
+def feed():
+    """Filtres et fil des messages : filtrer ne relance que cette partie"""
+    messages = filter_controls()
+    with timed("feed_render"):
+        render_feed(messages)
+
+def filter_controls():
+    """Filtres du fil (expéditeur, période, légende) ; renvoie les messages à afficher"""
+    with st.expander("🔎 Filtrer"):
+        senders = {"Tous": None, "Le cousin": "admin", "La cousine": "user"}
+        sender_label = st.selectbox("Expéditeur", list(senders), key="filter_sender")
+        period = st.date_input("Période", value=(), key="filter_period")
+        text = st.text_input("Mots de la légende (début suffit)", key="filter_text")
+    
+    sender = senders[sender_label]
+    start = period[0] if len(period) > 0 else None
+    end = period[1] if len(period) > 1 else start
+    
+    if sender is None and start is None and not text.strip():
+        return st.session_state.messages
+    
+    messages = filter_messages(st.session_state.message_index, sender, start, end, text)
+    st.caption(f"{len(messages)} message(s) correspondant(s)")
+    return messages
+
+def render_feed(messages):
+    """Affiche le fil des messages"""
+    if not messages:
+        st.info("Aucun message ne correspond")
+    
+    for msg in messages:
+        is_admin = msg['sender'] == "admin"
+        container_class = "message-container-admin" if is_admin else "message-container-user"
+        
+        st.markdown(f'<div class="{container_class}"><div class="message-content">', unsafe_allow_html=True)
+        
+        timestamp = datetime.fromisoformat(msg['timestamp']).strftime('%d/%m %H:%M')
+        st.write(f"**{timestamp}**")
+        
+        image_url = feed_image_url(msg)
+        if image_url:
+            st.markdown(f'<img src="{image_url}" style="width: 100%" loading="lazy">', unsafe_allow_html=True)
+        else:
+            st.image(feed_image_bytes(msg), use_container_width=True)
+        
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            ext, mime = message_image_type(msg, 'original_image')
+            st.download_button("📥", message_image_bytes(msg, 'original_image'), f"photo_{msg['id']}.{ext}", mime, key=f"dl_{msg['id']}")
+        with col2:
+            if st.button("🗑️", key=f"del_{msg['id']}"):
+                delete_message(msg['id'])
                 st.rerun()
-    
-    st.header("💬 Messages")
-    
-    if st.session_state.messages:
-        for msg in st.session_state.messages:
-            is_admin = msg['sender'] == "admin"
-            container_class = "message-container-admin" if is_admin else "message-container-user"
-            
-            st.markdown(f'<div class="{container_class}"><div class="message-content">', unsafe_allow_html=True)
-            
-            timestamp = datetime.fromisoformat(msg['timestamp']).strftime('%d/%m %H:%M')
-            st.write(f"**{timestamp}**")
-            
-            st.image(msg['image_with_text'], use_container_width=True)
-            
-            col1, col2 = st.columns([1, 1])
-            with col1:
-                img_bytes = io.BytesIO()
-                msg['original_image'].save(img_bytes, format='PNG')
-                st.download_button("📥", img_bytes.getvalue(), f"photo_{msg['id']}.png", "image/png", key=f"dl_{msg['id']}")
-            with col2:
-                if st.button("🗑️", key=f"del_{msg['id']}"):
-                    delete_message(msg['id'])
-                    st.rerun()
-            
-            st.markdown('</div></div>', unsafe_allow_html=True)
-            st.divider()
+        
+        st.markdown('</div></div>', unsafe_allow_html=True)
+        st.divider()
+
+def render_page():
+    """Affiche la page de connexion ou l'application"""
+    if not st.session_state.authenticated:
+        login_page()
     else:
-        st.info("Aucun message")
+        if 'messages' not in st.session_state:
+            adopt_history()
+        main_app()
 
-if not st.session_state.authenticated:
-    login_page()
-else:
-    main_app()
+def render_page_profiled():
+    """Exécute un rerun sous cProfile et garde le dump pour téléchargement"""
+    st.session_state.profile_next_rerun = False
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(render_page)
+    finally:
+        profiler.create_stats()
+        st.session_state.profile_dump = marshal.dumps(profiler.stats)
+
+with timed("rerun"):
+    if st.session_state.get('profile_next_rerun'):
+        render_page_profiled()
+    else:
+        render_page()
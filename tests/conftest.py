@@ -0,0 +1,39 @@
+"""Importe streamlit_app une seule fois, Streamlit et GitHub remplacés par les bouchons des benchmarks."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_hot_paths as bench  # noqa: E402
+
+
+def message(msg_id, timestamp, sender='user', text=""):
+    """Métadonnées d'un message, sans images"""
+    return {'id': msg_id, 'timestamp': timestamp, 'sender': sender, 'text': text}
+
+
+@pytest.fixture(scope='session')
+def loaded_app():
+    return bench.import_app()
+
+
+@pytest.fixture
+def github(loaded_app):
+    _, fake, _ = loaded_app
+    fake.files.clear()
+    fake.transport.clear()
+    return fake
+
+
+@pytest.fixture
+def app(loaded_app, github, monkeypatch):
+    app, fake, _ = loaded_app
+    for name in ('get_file', 'open_file', 'get_sha', 'update_file'):
+        monkeypatch.setattr(app, f'github_{name}', getattr(fake, name))
+    app.st.session_state.clear()
+    app.get_recent_photo_hashes()['by_sender'].clear()
+    app.get_prefetch_state()['futures'].clear()
+    return app
+
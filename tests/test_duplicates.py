@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+from bench_hot_paths import synthetic_photo
+
+
+def jpeg(image):
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=90)
+    out.seek(0)
+    return out
+
+
+def dhash(app, image):
+    """Empreinte calculée comme pour une photo de la caméra"""
+    return app.ingest_photo(jpeg(image))['dhash']
+
+
+def test_difference_hash_tolerates_small_changes(app):
+    photo = synthetic_photo(320, 240, seed=0)
+    brighter = photo.point(lambda v: min(255, v + 8))
+    other_noise = synthetic_photo(320, 240, seed=1)
+    other = photo.rotate(90)
+    assert (dhash(app, photo) ^ dhash(app, brighter)).bit_count() <= app.DUPLICATE_HASH_THRESHOLD
+    assert (dhash(app, photo) ^ dhash(app, other_noise)).bit_count() <= app.DUPLICATE_HASH_THRESHOLD
+    assert (dhash(app, photo) ^ dhash(app, other)).bit_count() > app.DUPLICATE_HASH_THRESHOLD
+
+
+def test_claim_rejects_near_duplicate_from_same_sender(app):
+    assert app.claim_photo('user', 0b1010)
+    assert not app.claim_photo('user', 0b1011)
+    assert app.claim_photo('admin', 0b1010)
+
+
+def test_release_allows_retry_after_failed_send(app):
+    assert app.claim_photo('user', 42)
+    app.release_photo('user', 42)
+    assert app.claim_photo('user', 42)
+
+
+def test_claims_expire_after_window(app, monkeypatch):
+    assert app.claim_photo('user', 7)
+    monkeypatch.setattr(app, 'DUPLICATE_WINDOW_SECONDS', -1)
+    assert app.claim_photo('user', 7)
+
+
+@pytest.fixture
+def composer_sending(app, monkeypatch):
+    """Composer avec une photo prise, une légende et le bouton Envoyer cliqué"""
+    photo = jpeg(synthetic_photo(320, 240, seed=3))
+    for name, value in (('camera_input', photo), ('text_input', "coucou"), ('button', True)):
+        monkeypatch.setattr(app.st, name, lambda *args, value=value, **kwargs: value, raising=False)
+    monkeypatch.setattr(app, 'verify_human_body_simple', lambda *args: True)
+    app.st.session_state.current_user = 'user'
+    return app.ingest_photo(jpeg(synthetic_photo(320, 240, seed=3)))['dhash']
+
+
+def test_claim_released_when_send_fails(app, monkeypatch, composer_sending):
+    calls = []
+    monkeypatch.setattr(app, 'save_message', lambda *args: calls.append(args) or False)
+    app.composer()
+    assert len(calls) == 1
+    assert app.claim_photo('user', composer_sending)
+
+
+def test_claim_released_when_send_raises(app, monkeypatch, composer_sending):
+    def broken(*args):
+        raise RuntimeError("GitHub injoignable")
+
+    monkeypatch.setattr(app, 'save_message', broken)
+    with pytest.raises(RuntimeError, match="injoignable"):
+        app.composer()
+    assert app.claim_photo('user', composer_sending)
@@ -0,0 +1,85 @@
+import base64
+import io
+import json
+import tempfile
+import zipfile
+
+import pytest
+
+from bench_hot_paths import _reset_session, synthetic_messages, synthetic_photo
+
+
+def encoded_image(fmt):
+    out = io.BytesIO()
+    synthetic_photo(32, 24).save(out, format=fmt)
+    return out.getvalue()
+
+
+def test_write_history_zip(app):
+    png, jpeg = encoded_image('PNG'), encoded_image('JPEG')
+    data = {'messages': [
+        {'id': 1, 'timestamp': "2024-01-01T10:00:00", 'sender': 'user', 'text': "été",
+         'original_image_b64': base64.b64encode(jpeg).decode(), 'image_with_text_b64': base64.b64encode(png).decode()},
+        {'id': 2, 'timestamp': "pas une date", 'sender': 'admin', 'text': ""},
+    ]}
+    out = io.BytesIO()
+    assert app.write_history_zip(io.BytesIO(json.dumps(data).encode()), out) == 2
+
+    archive = zipfile.ZipFile(out)
+    assert archive.read('originaux/photo_1.jpg') == jpeg
+    assert archive.read('legendees/photo_1.png') == png
+    metadata = json.loads(archive.read('messages.json'))
+    assert metadata[0]['text'] == "été" and metadata[0]['originaux'] == 'originaux/photo_1.jpg'
+    assert metadata[1] == {'id': 2, 'timestamp': "pas une date", 'sender': 'admin', 'text': ""}
+
+
+def test_export_history_archive_streams_to_disk(app, github):
+    _reset_session(app, synthetic_messages(app, 3, (32, 24)))
+    assert app.save_messages()
+
+    with tempfile.TemporaryFile() as out:
+        assert app.export_history_archive(out) == 3
+        out.seek(0)
+        names = zipfile.ZipFile(out).namelist()
+    assert len([name for name in names if name.startswith('originaux/')]) == 3
+
+
+def test_export_history_archive_without_history(app, github):
+    with tempfile.TemporaryFile() as out:
+        assert app.export_history_archive(out) is None
+
+
+@pytest.fixture
+def export_clicked(app, monkeypatch):
+    """Panel admin rendu avec le bouton d'export cliqué ; renvoie les téléchargements proposés"""
+    offered = []
+
+    def download_button(label, data, file_name=None, mime=None, **kwargs):
+        data.seek(0)
+        offered.append((file_name, data.read()))
+
+    monkeypatch.setattr(app.st, 'button', lambda label, *args, **kwargs: label.startswith("📦"), raising=False)
+    monkeypatch.setattr(app.st, 'download_button', download_button, raising=False)
+    app.st.session_state.user_passwords = ["crush"]
+    return offered
+
+
+def test_admin_export_offers_the_archive_without_keeping_it(app, github, export_clicked):
+    _reset_session(app, synthetic_messages(app, 2, (32, 24)))
+    assert app.save_messages()
+
+    app.admin_panel()
+
+    [(file_name, data)] = export_clicked
+    assert file_name == "messagerie_photo.zip"
+    assert 'messages.json' in zipfile.ZipFile(io.BytesIO(data)).namelist()
+    assert not any(isinstance(value, (bytes, bytearray)) for value in app.st.session_state.values())
+
+
+def test_admin_export_failure_offers_nothing(app, github, monkeypatch, export_clicked):
+    def unavailable(file_path):
+        raise app.DataUnavailable("HTTP 503")
+
+    monkeypatch.setattr(app, 'github_open_file', unavailable)
+    app.admin_panel()
+    assert export_clicked == []
@@ -0,0 +1,74 @@
+import hashlib
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from bench_hot_paths import synthetic_photo
+
+
+@pytest.fixture
+def feed_dir(app, tmp_path, monkeypatch):
+    feed_dir = tmp_path / 'feed'
+    monkeypatch.setattr(app, 'FEED_STATIC_DIR', str(feed_dir))
+    app.get_feed_url_key.cache_clear()
+    yield feed_dir
+    app.get_feed_url_key.cache_clear()
+
+
+def session_message(app, image):
+    state = app.st.session_state
+    state.messages = []
+    state.message_index = app.build_message_index(state.messages)
+    state.stats = app.empty_stats()
+    state.user_passwords = ["crush"]
+    assert app.save_message(image, "", image, 'user')
+    return state.messages[0]
+
+
+def test_feed_serves_a_jpeg_named_by_keyed_hash(app, feed_dir):
+    msg = session_message(app, synthetic_photo(64, 48))
+    digest, path = app.feed_image_path(msg)
+
+    assert app.feed_image_url(msg) == f"./app/static/feed/{digest}.jpg?v={digest}"
+    with open(path, 'rb') as f:
+        assert Image.open(f).format == 'JPEG'
+    # Sans la clé, le contenu de la photo ne suffit pas à retrouver l'URL
+    assert digest not in hashlib.sha256(app.message_image_bytes(msg, 'image_with_text')).hexdigest()
+
+
+def test_changing_the_key_changes_every_url(app, feed_dir, monkeypatch):
+    msg = {'image_with_text': synthetic_photo(16, 16)}
+    monkeypatch.setattr(app, 'FEED_URL_KEY', "première")
+    first, _ = app.feed_image_path(msg)
+    app.get_feed_url_key.cache_clear()
+    monkeypatch.setattr(app, 'FEED_URL_KEY', "seconde")
+    assert app.feed_image_path(msg)[0] != first
+
+
+def test_stale_files_are_cleared_at_startup(app, feed_dir):
+    feed_dir.mkdir()
+    (feed_dir / "ancien.jpg").write_bytes(b"x")
+    (feed_dir / "ancien.jpg.12.34.tmp").write_bytes(b"x")
+
+    msg = {'image_with_text': synthetic_photo(16, 16)}
+    app.feed_image_url(msg)
+    assert sorted(os.listdir(feed_dir)) == [os.path.basename(app.feed_image_path(msg)[1])]
+
+
+def test_jpeg_original_is_published_as_is(app, feed_dir):
+    data = io.BytesIO()
+    synthetic_photo(32, 24).save(data, format='JPEG')
+    msg = {'image_with_text': Image.open(io.BytesIO(data.getvalue())), 'image_with_text_bytes': data.getvalue()}
+    assert app.feed_image_bytes(msg) == data.getvalue()
+
+
+def test_deleted_message_photo_leaves_public_folder(app, feed_dir):
+    msg = session_message(app, synthetic_photo(64, 48))
+    app.feed_image_url(msg)
+    _, path = app.feed_image_path(msg)
+    assert os.path.exists(path)
+
+    app.delete_message(msg['id'])
+    assert not os.path.exists(path)
@@ -0,0 +1,103 @@
+import random
+from datetime import date, timedelta
+
+from conftest import message
+
+
+WORDS = ["plage", "plagiat", "soleil", "chat", "bonjour", "la", "mer"]
+
+
+def random_message(rng, msg_id):
+    day = date(2024, 1, 1) + timedelta(days=rng.randrange(10))
+    return message(
+        msg_id, f"{day.isoformat()}T{rng.randrange(24):02d}:00:00",
+        rng.choice(['admin', 'user']), " ".join(rng.sample(WORDS, rng.randrange(3)))
+    )
+
+
+def naive_filter(app, messages, sender, start, end, text):
+    """Même résultat que filter_messages, par simple parcours"""
+    terms = app.caption_words(text)
+    result = []
+    for msg in sorted(messages, key=app.message_key):
+        day = date.fromisoformat(msg['timestamp'][:10])
+        words = app.caption_words(msg['text'])
+        if sender and msg['sender'] != sender:
+            continue
+        if start and day < start or end and day > end:
+            continue
+        if not all(any(word.startswith(term) for word in words) for term in terms):
+            continue
+        result.append(msg)
+    return result
+
+
+QUERIES = [
+    (None, None, None, ""),
+    ('admin', None, None, ""),
+    (None, date(2024, 1, 3), date(2024, 1, 5), ""),
+    ('user', date(2024, 1, 2), None, "pla"),
+    (None, None, None, "plage"),
+    (None, None, None, "chat so"),
+]
+
+
+def assert_consistent(app, index, messages):
+    assert [app.message_key(m) for m in messages] == index['by_time']
+    assert index['by_time'] == sorted(index['by_time'])
+    assert set(index['by_id']) == {m['id'] for m in messages}
+    assert index['word_list'] == sorted(index['words'])
+    for sender, keys in index['by_sender'].items():
+        assert keys == sorted(app.message_key(m) for m in messages if m['sender'] == sender)
+    for query in QUERIES:
+        assert app.filter_messages(index, *query) == naive_filter(app, messages, *query)
+
+
+def test_build_sorts_messages_chronologically(app):
+    messages = [message(2, "2024-01-02T10:00:00"), message(1, "2024-01-01T10:00:00")]
+    index = app.build_message_index(messages)
+    assert [m['id'] for m in messages] == [1, 2]
+    assert_consistent(app, index, messages)
+
+
+def test_add_and_remove_keep_index_consistent(app):
+    rng = random.Random(0)
+    messages = [random_message(rng, i) for i in range(20)]
+    index = app.build_message_index(messages)
+    assert_consistent(app, index, messages)
+
+    next_id = 20
+    for _ in range(60):
+        if messages and rng.random() < 0.4:
+            app.index_remove(index, messages, rng.choice(messages))
+        else:
+            app.index_add(index, messages, random_message(rng, next_id))
+            next_id += 1
+        assert_consistent(app, index, messages)
+
+
+def test_remove_drops_words_no_longer_used(app):
+    messages = [message(1, "2024-01-01T10:00:00", text="plagiat"), message(2, "2024-01-02T10:00:00", text="plage")]
+    index = app.build_message_index(messages)
+    app.index_remove(index, messages, messages[0])
+    assert index['word_list'] == ["plage"]
+    assert app.filter_messages(index, text="plagi") == []
+
+
+def test_caption_filter_matches_word_prefixes(app):
+    messages = [
+        message(1, "2024-01-01T10:00:00", text="Bonjour PLAGE"),
+        message(2, "2024-01-02T10:00:00", text="plagiat"),
+        message(3, "2024-01-03T10:00:00", text="soleil"),
+    ]
+    index = app.build_message_index(messages)
+    assert [m['id'] for m in app.filter_messages(index, text="plag")] == [1, 2]
+    assert [m['id'] for m in app.filter_messages(index, text="plage bon")] == [1]
+    assert app.filter_messages(index, text="lage") == []
+
+
+def test_period_filter_includes_end_day(app):
+    messages = [message(i, f"2024-01-0{i}T23:59:00") for i in range(1, 5)]
+    index = app.build_message_index(messages)
+    result = app.filter_messages(index, start=date(2024, 1, 2), end=date(2024, 1, 3))
+    assert [m['id'] for m in result] == [2, 3]
@@ -0,0 +1,36 @@
+import io
+
+from PIL import Image
+
+from bench_hot_paths import synthetic_photo
+
+
+def encoded(image, fmt='JPEG', **params):
+    out = io.BytesIO()
+    image.save(out, format=fmt, **params)
+    out.seek(0)
+    return out
+
+
+def test_exif_orientation_is_applied(app):
+    # Orientation 6 : capteur tenu en portrait, pixels stockés en paysage
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    photo = app.ingest_photo(encoded(synthetic_photo(400, 200), exif=exif))
+    assert photo['image'].size == (200, 400)
+
+
+def test_long_edge_is_capped(app):
+    photo = app.ingest_photo(encoded(synthetic_photo(3000, 2000)))
+    assert max(photo['image'].size) == app.MAX_IMAGE_EDGE
+    assert photo['image'].size[1] == round(app.MAX_IMAGE_EDGE * 2 / 3)
+
+
+def test_small_photo_keeps_its_size_and_becomes_rgb(app):
+    photo = app.ingest_photo(encoded(synthetic_photo(64, 48).convert('RGBA'), 'PNG'))
+    assert photo['image'].size == (64, 48)
+    assert photo['image'].mode == 'RGB'
+    if app.CV2_AVAILABLE:
+        assert photo['rgb'].shape == (48, 64, 3)
+        assert photo['gray'].shape == (48, 64)
+    assert 0 <= photo['dhash'] < 2 ** 64
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from bench_hot_paths import _reset_session, synthetic_messages, synthetic_photo
+
+
+@pytest.fixture
+def published(app, github):
+    """Cinq messages publiés, puis une session vierge comme après la connexion"""
+    _reset_session(app, synthetic_messages(app, 5, (16, 16)))
+    assert app.save_messages()
+    # Réglages déjà publiés : la migration ne relit pas le fichier de données
+    assert app.update_settings(lambda settings: None)
+    app.st.session_state.clear()
+    app.get_prefetch_state()['futures'].clear()
+    return github
+
+
+def published_ids(app, github):
+    return [msg['id'] for msg in json.loads(github.files[app.DATA_FILE][0])['messages']]
+
+
+def failing_reads(app, monkeypatch, failures):
+    """Fait échouer les `failures` prochaines lectures du fichier de données, comme un 503"""
+    open_file = app.github_open_file
+    remaining = [failures]
+
+    def flaky(file_path):
+        if remaining[0]:
+            remaining[0] -= 1
+            raise app.DataUnavailable(f"{file_path} : HTTP 503")
+        return open_file(file_path)
+
+    monkeypatch.setattr(app, 'github_open_file', flaky)
+
+
+def login(app):
+    app.st.session_state.current_user = 'user'
+    app.adopt_history()
+
+
+def test_failed_read_is_not_adopted_nor_published(app, published, monkeypatch):
+    failing_reads(app, monkeypatch, 2)
+    app.prefetch_history()
+    login(app)
+
+    assert app.st.session_state.messages == []
+    assert app.st.session_state.messages_sha is None
+    photo = synthetic_photo(16, 16)
+    assert app.save_message(photo, "", photo, 'user') is False
+    assert len(published_ids(app, published)) == 5
+
+
+def test_failed_prefetch_is_resubmitted(app, published, monkeypatch):
+    failing_reads(app, monkeypatch, 1)
+    futures = app.prefetch_history()
+    with pytest.raises(app.DataUnavailable):
+        futures['messages'].result()
+
+    login(app)
+
+    assert len(app.st.session_state.messages) == 5
+    assert app.st.session_state.messages_sha == published.get_sha(app.DATA_FILE)
+
+
+def test_first_message_creates_the_history(app, github):
+    login(app)
+    assert app.st.session_state.messages == []
+
+    photo = synthetic_photo(16, 16)
+    assert app.save_message(photo, "premier", photo, 'user')
+    assert len(published_ids(app, github)) == 1
+    assert app.st.session_state.messages_sha == github.get_sha(app.DATA_FILE)
+
+
+def test_unchanged_history_is_not_downloaded_again(app, published, monkeypatch):
+    first = app.fetch_messages()
+    monkeypatch.setattr(app, 'github_open_file', lambda file_path: pytest.fail("téléchargement inutile"))
+    assert app.fetch_messages(first) is first
+
+
+def test_sessions_get_their_own_message_dicts(app, published):
+    login(app)
+    mine = app.st.session_state.messages
+    app.st.session_state.clear()
+    login(app)
+    theirs = app.st.session_state.messages
+
+    assert [msg['id'] for msg in mine] == [msg['id'] for msg in theirs]
+    assert all(a is not b for a, b in zip(mine, theirs))
+    mine[0]['image_with_text_url'] = "./app/static/feed/x.jpg"
+    assert 'image_with_text_url' not in theirs[0]
@@ -0,0 +1,74 @@
+import base64
+import io
+import json
+import os
+import sys
+
+import pytest
+
+from bench_hot_paths import synthetic_photo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import repack_history  # noqa: E402
+
+
+def uncompressed_png(seed):
+    out = io.BytesIO()
+    synthetic_photo(48, 32, seed=seed).save(out, format='PNG', compress_level=0)
+    return out.getvalue()
+
+
+@pytest.fixture
+def history(tmp_path):
+    messages = []
+    for idx in range(5):
+        png = base64.b64encode(uncompressed_png(idx)).decode()
+        messages.append({'timestamp': f"2024-01-0{idx + 1}T10:00:00", 'text': f"m{idx}", 'sender': 'user',
+                         'id': idx, 'image_with_text_b64': png, 'original_image_b64': png})
+    path = tmp_path / 'messages_data.json'
+    path.write_text(json.dumps({'messages': messages, 'passwords': ["crush"]}, indent=2))
+    return path, messages
+
+
+def read_images(app, path):
+    with open(path, 'rb') as f:
+        return [(msg['id'], msg['original_image'].tobytes()) for msg in app.iter_messages(f)]
+
+
+def test_repack_round_trip_is_lossless_and_smaller(app, history, tmp_path):
+    path, _ = history
+    output = tmp_path / 'repacked.json'
+    progress = repack_history.repack(str(path), str(output), workers=2)
+
+    assert progress['done'] == 5 and progress['failed'] == 0
+    assert progress['after'] < progress['before']
+    assert os.path.getsize(output) < os.path.getsize(path)
+    assert read_images(app, output) == read_images(app, path)
+    assert json.loads(output.read_text())['passwords'] == ["crush"]
+    assert not os.path.exists(f"{output}.progress") and not os.path.exists(f"{output}.partial")
+
+
+def test_interrupted_repack_resumes_without_duplicates(app, history, tmp_path, monkeypatch, capsys):
+    path, _ = history
+    output = tmp_path / 'repacked.json'
+    save_progress = repack_history.save_progress
+
+    def interrupted(progress_path, progress):
+        save_progress(progress_path, progress)
+        if progress['done'] == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(repack_history, 'save_progress', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        repack_history.repack(str(path), str(output), workers=1, window=1)
+    assert not output.exists()
+
+    monkeypatch.setattr(repack_history, 'save_progress', save_progress)
+    capsys.readouterr()
+    progress = repack_history.repack(str(path), str(output), workers=1)
+
+    assert "Reprise après 2 messages" in capsys.readouterr().err
+    assert progress['done'] == 5
+    assert [msg_id for msg_id, _ in read_images(app, output)] == [0, 1, 2, 3, 4]
+    assert read_images(app, output) == read_images(app, path)
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+
+def test_update_settings_retries_after_conflict(app, github, monkeypatch):
+    app.update_settings(lambda settings: settings['passwords'].append("a"))
+    calls = []
+
+    def racing_update(file_path, content, sha=None, message=""):
+        calls.append(sha)
+        if len(calls) == 1:
+            # Un autre écrivain passe entre la lecture et l'écriture
+            github.update_file(file_path, json.dumps({'version': 5, 'passwords': ["crush", "a", "b"]}))
+            return False
+        return github.update_file(file_path, content, sha, message)
+
+    monkeypatch.setattr(app, 'github_update_file', racing_update)
+    settings = app.update_settings(lambda settings: settings['passwords'].append("c"))
+
+    assert settings['passwords'] == ["crush", "a", "b", "c"]
+    assert settings['version'] == 6
+    assert calls[0] != calls[1]
+
+
+def test_fetch_settings_migrates_legacy_passwords_once(app, github):
+    github.update_file(app.DATA_FILE, json.dumps({'messages': [], 'passwords': ["crush", "ancien"]}))
+
+    assert app.fetch_settings()['passwords'] == ["crush", "ancien"]
+    assert 'passwords' not in json.loads(github.files[app.DATA_FILE][0])
+    assert json.loads(github.files[app.SETTINGS_FILE][0])['passwords'] == ["crush", "ancien"]
+
+
+def test_fetch_settings_does_not_migrate_on_read_error(app, github, monkeypatch):
+    github.update_file(app.DATA_FILE, json.dumps({'messages': [], 'passwords': ["crush", "révoqué"]}))
+    github.update_file(app.SETTINGS_FILE, json.dumps({'version': 3, 'passwords': ["crush"]}))
+    before = github.files[app.SETTINGS_FILE]
+
+    def unavailable(file_path):
+        raise app.DataUnavailable("HTTP 503")
+
+    monkeypatch.setattr(app, 'github_get_file', unavailable)
+    with pytest.raises(app.DataUnavailable):
+        app.fetch_settings()
+    assert github.files[app.SETTINGS_FILE] == before
+
+
+def test_update_settings_skips_the_write_when_change_returns_false(app, github):
+    app.update_settings(lambda settings: settings['passwords'].append("a"))
+    before = github.files[app.SETTINGS_FILE]
+    settings = app.update_settings(lambda settings: False)
+    assert settings['passwords'] == ["crush", "a"]
+    assert github.files[app.SETTINGS_FILE] == before
+
+
+def test_password_check_reads_settings_only(app, github, monkeypatch):
+    github.update_file(app.DATA_FILE, json.dumps({'messages': []}))
+    app.update_settings(lambda settings: settings['passwords'].append("nouveau"))
+    monkeypatch.setattr(app, 'github_open_file', lambda file_path: pytest.fail("historique téléchargé"))
+
+    assert "nouveau" in app.get_user_passwords()
+    assert 'messages' not in app.get_prefetch_state()['futures']
@@ -0,0 +1,123 @@
+import copy
+import json
+import random
+from datetime import date
+
+from bench_hot_paths import synthetic_photo
+from conftest import message
+
+
+def test_incremental_updates_match_rebuild(app):
+    rng = random.Random(1)
+    messages = []
+    stats = app.empty_stats()
+    for msg_id in range(50):
+        if messages and rng.random() < 0.3:
+            msg = messages.pop(rng.randrange(len(messages)))
+            app.stats_remove(stats, msg, messages[-1]['id'] if messages else None)
+        else:
+            msg = message(msg_id, f"2024-01-{1 + msg_id % 9:02d}T10:00:{msg_id:02d}", rng.choice(['admin', 'user']))
+            messages.append(msg)
+            app.stats_add(stats, msg)
+        assert stats == app.rebuild_stats(messages)
+        assert app.stats_match(stats, messages)
+
+
+def test_stats_match_detects_per_sender_drift(app):
+    messages = [message(1, "2024-01-01T10:00:00", 'admin'), message(2, "2024-01-01T11:00:00", 'user')]
+    stats = app.rebuild_stats(messages)
+    stats['totals'] = {'admin': 2, 'user': 0}
+    assert not app.stats_match(stats, messages)
+
+
+def test_current_streak(app):
+    stats = app.empty_stats()
+    for day in ("2024-01-01", "2024-01-02", "2024-01-04", "2024-01-05"):
+        app.stats_add(stats, message(day, f"{day}T10:00:00", 'user'))
+    assert app.current_streak(stats, 'user', today=date(2024, 1, 5)) == 2
+    assert app.current_streak(stats, 'user', today=date(2024, 1, 6)) == 2
+    assert app.current_streak(stats, 'user', today=date(2024, 1, 7)) == 0
+    assert app.current_streak(stats, 'admin', today=date(2024, 1, 5)) == 0
+
+
+def session_with(app, messages, stats, sha=None):
+    state = app.st.session_state
+    state.clear()
+    state.messages = list(messages)
+    state.messages_sha = sha
+    state.message_index = app.build_message_index(state.messages)
+    state.stats = copy.deepcopy(stats)
+    state.user_passwords = ["crush"]
+    return dict(state)
+
+
+def test_concurrent_sends_both_count_in_published_stats(app, github):
+    photo = synthetic_photo(16, 16)
+    stats = app.empty_stats()
+    # Les deux sessions ont chargé le même historique publié
+    sha = github.update_file(app.DATA_FILE, json.dumps({'messages': []}))
+    first = session_with(app, [], stats, sha)
+    second = session_with(app, [], stats, sha)
+
+    for state, sender in ((first, 'admin'), (second, 'user')):
+        app.st.session_state.clear()
+        app.st.session_state.update(state)
+        assert app.save_message(photo, "", photo, sender)
+
+    published = json.loads(github.files[app.SETTINGS_FILE][0])['stats']
+    assert published['totals'] == {'admin': 1, 'user': 1}
+    assert published['message_count'] == 2
+
+
+def test_failed_send_leaves_session_untouched(app, monkeypatch):
+    photo = synthetic_photo(16, 16)
+    session_with(app, [], app.empty_stats())
+    monkeypatch.setattr(app, 'github_update_file', lambda *args, **kwargs: False)
+
+    assert app.save_message(photo, "coucou", photo, 'user') is False
+    assert app.st.session_state.messages == []
+    assert app.st.session_state.stats == app.empty_stats()
+
+
+def published_stats(app, github):
+    return json.loads(github.files[app.SETTINGS_FILE][0])['stats']
+
+
+def test_sync_stats_republishes_drift_from_current_file(app, github):
+    messages = [message(1, "2024-01-01T10:00:00", 'admin'), message(2, "2024-01-02T10:00:00", 'user')]
+    github.update_file(app.DATA_FILE, json.dumps({'messages': messages}))
+    github.update_file(app.SETTINGS_FILE, json.dumps({'version': 1, 'stats': app.empty_stats()}))
+    session_with(app, messages, app.empty_stats())
+
+    app.sync_stats(messages, github.get_sha(app.DATA_FILE))
+
+    assert published_stats(app, github) == app.rebuild_stats(messages)
+    assert app.st.session_state.stats == app.rebuild_stats(messages)
+
+
+def test_sync_stats_keeps_published_stats_when_snapshot_is_stale(app, github):
+    # La session a chargé un message ; un autre envoi a été publié depuis, avec ses statistiques
+    stale = [message(1, "2024-01-01T10:00:00", 'admin')]
+    github.update_file(app.DATA_FILE, json.dumps({'messages': stale}))
+    stale_sha = github.get_sha(app.DATA_FILE)
+    current = stale + [message(2, "2024-01-02T10:00:00", 'user')]
+    github.update_file(app.DATA_FILE, json.dumps({'messages': current}))
+    github.update_file(app.SETTINGS_FILE, json.dumps({'version': 4, 'stats': app.rebuild_stats(current)}))
+    before = github.files[app.SETTINGS_FILE]
+    session_with(app, stale, app.rebuild_stats(current))
+
+    app.sync_stats(stale, stale_sha)
+
+    assert github.files[app.SETTINGS_FILE] == before
+    assert app.st.session_state.stats == app.rebuild_stats(current)
+
+
+def test_sync_stats_never_publishes_without_a_snapshot(app, github):
+    github.update_file(app.SETTINGS_FILE, json.dumps({'version': 2, 'stats': app.rebuild_stats([message(1, "2024-01-01T10:00:00")])}))
+    before = github.files[app.SETTINGS_FILE]
+    session_with(app, [], app.empty_stats())
+    app.st.session_state.stats['totals']['user'] = 3
+
+    app.sync_stats([], None)
+
+    assert github.files[app.SETTINGS_FILE] == before
@@ -0,0 +1,34 @@
+import base64
+import random
+
+import pytest
+
+from bench_hot_paths import _reset_session, synthetic_messages
+
+
+@pytest.mark.parametrize('chunk_size', [5, 61, 65536])
+def test_base64_reader_decodes_wrapped_text_in_pieces(app, chunk_size):
+    data = random.Random(chunk_size).randbytes(5000)
+    reader = app.Base64Reader(base64.encodebytes(data).decode('ascii'), chunk_size=chunk_size)
+    pieces = []
+    while True:
+        piece = reader.read(777)
+        if not piece:
+            break
+        pieces.append(piece)
+    assert b"".join(pieces) == data
+
+
+@pytest.mark.parametrize('count, size', [(3, (32, 24)), (2, (400, 300))])
+def test_load_messages_reads_back_saved_history(app, github, count, size):
+    # (400, 300) dépasse 900 Ko : le fichier est relu comme blob brut plutôt qu'en base64
+    _reset_session(app, synthetic_messages(app, count, size))
+    saved = [dict(msg) for msg in app.st.session_state.messages]
+    assert app.save_messages()
+    assert isinstance(github.transport[app.DATA_FILE], bytes) == (size == (400, 300))
+
+    loaded = app.load_messages()
+    assert [msg['id'] for msg in loaded] == [msg['id'] for msg in saved]
+    for before, after in zip(saved, loaded):
+        assert after['image_with_text'].size == size
+        assert list(after['original_image'].getdata()) == list(before['original_image'].getdata())